@@ -0,0 +1,122 @@
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from chess.bitboard import COLOR_NAMES, move_to_uci
+from chess.pgn import read_files, parse_san, move_to_san
+from chess.position import Position
+from chess.search import Searcher
+from chess.transposition import TranspositionTable
+
+# Headless analysis of PGN archives: games are read one at a time, handed to a pool of
+# worker processes, and the results are written as JSON lines in game order. At most a
+# few games per worker are in flight, so memory does not depend on the archive size.
+
+_worker_tt = None
+
+
+def _init_worker(hash_mb):
+    global _worker_tt
+    _worker_tt = TranspositionTable(hash_mb)
+
+
+def analyse_game(game, depth=None, time_ms=None, tt=None, index=0):
+    # One record per position before each move of the game, replayed through
+    # Position.process_move. Stops at the first move that is not legal, a bad FEN tag
+    # gives a single error record.
+    records = []
+    try:
+        position = Position(game["headers"].get("FEN"))
+    except ValueError as error:
+        return [{"game": index, "ply": 0, "fen": game["headers"].get("FEN"), "error": str(error)}]
+    tt = tt if tt is not None else TranspositionTable()
+    for (ply, san) in enumerate(game["moves"]):
+        bitboard = position.bitboard
+        try:
+            move = parse_san(bitboard, san)
+        except ValueError as error:
+            records.append({"game": index, "ply": ply, "fen": position.to_fen(), "error": str(error)})
+            break
+        result = Searcher(bitboard, tt).search(depth, time_ms)
+        best = result["best_move"]
+        records.append({"game": index,
+                        "ply": ply,
+                        "fen": position.to_fen(),
+                        "played": san,
+                        "best": move_to_san(bitboard, best) if best else None,
+                        "pv": [move_to_uci(pv_move) for pv_move in result["pv"]],
+                        "score": result["score"],
+                        "depth": result["depth"],
+                        "nodes": result["nodes"]})
+        position.process_move(COLOR_NAMES[bitboard.turn], move)
+    return records
+
+
+def _worker_analyse(args):
+    (index, game, depth, time_ms) = args
+    _worker_tt.clear()
+    return analyse_game(game, depth, time_ms, _worker_tt, index)
+
+
+def analyse_files(paths, out, depth=None, time_ms=None, workers=None, hash_mb=16, skip=0, limit=None):
+    # Analyses every game of the PGN files and writes JSON lines to out. Returns
+    # (games, positions) written.
+    games = positions = 0
+    workers = workers or os.cpu_count()
+    pending = collections.deque()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(hash_mb,)) as pool:
+        in_flight = 2 * workers
+        for (index, game) in enumerate(read_files(paths)):
+            if index < skip:
+                continue
+            if limit is not None and index >= skip + limit:
+                break
+            pending.append(pool.submit(_worker_analyse, (index, game, depth, time_ms)))
+            while len(pending) >= in_flight:
+                positions += _write_records(pending.popleft().result(), out)
+                games += 1
+        while pending:
+            positions += _write_records(pending.popleft().result(), out)
+            games += 1
+    return (games, positions)
+
+def _write_records(records, out):
+    for record in records:
+        out.write(json.dumps(record) + '\n')
+    out.flush()
+    return len(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse the games of PGN files, writing JSON lines.")
+    parser.add_argument("pgn", nargs="+")
+    parser.add_argument("-o", "--output", help="JSONL file to append to (default stdout)")
+    parser.add_argument("--depth", type=int, default=None)
+    parser.add_argument("--movetime", type=int, default=None, help="milliseconds per position")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--hash", type=int, default=16, help="transposition table MB per worker")
+    parser.add_argument("--skip", type=int, default=0, help="games to skip, to resume a run")
+    parser.add_argument("--limit", type=int, default=None, help="games to analyse")
+    args = parser.parse_args(argv)
+    if args.depth is None and args.movetime is None:
+        args.depth = 4
+
+    out = open(args.output, 'a') if args.output else sys.stdout
+    start = time.perf_counter()
+    try:
+        (games, positions) = analyse_files(args.pgn, out, args.depth, args.movetime, args.workers,
+                                           args.hash, args.skip, args.limit)
+    finally:
+        if args.output:
+            out.close()
+    elapsed = time.perf_counter() - start
+    print(f"{games} games, {positions} positions in {elapsed:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
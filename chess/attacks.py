@@ -0,0 +1,108 @@
+from chess.bitboard import BISHOP, ROOK, QUEEN, attacks, iter_squares
+
+# Who attacks what, kept up to date move by move. For every square the map holds the
+# squares attacked by the piece standing on it, and for both colors the squares of the
+# pieces attacking it, so "is X attacked by C" is a single bit test.
+#
+# After a move only two kinds of piece can attack differently: the ones on the squares
+# that changed (moved, captured, castled rook) and the sliders whose rays reached one of
+# those squares before the move. A slider that reaches a changed square afterwards
+# already reached it before, or reached another changed square on the way, so the old
+# attacker sets of the changed squares name every slider to recompute.
+
+class AttackMap:
+    def __init__(self, position, debug=False):
+        # position is a BitboardPosition; update() must be called with the squares
+        # that changed every time a move is made on it or taken back
+        self.position = position
+        # with debug set every update is compared with a full recomputation
+        self.debug = debug
+        self.rebuild()
+
+    def rebuild(self):
+        self.attacks = [0] * 64
+        self.colors = bytearray(64)
+        self.attackers = ([0] * 64, [0] * 64)
+        self.attacked = [0, 0]
+        for sq in iter_squares(self.position.all_occupied()):
+            self.__recompute(sq)
+
+    def update(self, changed_squares):
+        # Brings the map up to date after the pieces on changed_squares moved, appeared
+        # or disappeared. Returns the bitboard of the squares whose attacks were
+        # recomputed.
+        position = self.position
+        (white, black) = self.attackers
+        changed = 0
+        reaching = 0
+        for sq in changed_squares:
+            changed |= 1 << sq
+            reaching |= white[sq] | black[sq]
+        sliders = 0
+        for pieces in position.pieces:
+            sliders |= pieces[BISHOP] | pieces[ROOK] | pieces[QUEEN]
+        # knights, kings and pawns that attack a changed square keep attacking it
+        affected = changed | (reaching & sliders)
+        for sq in iter_squares(affected):
+            self.__recompute(sq)
+        if self.debug:
+            self.check()
+        return affected
+
+    def __recompute(self, sq):
+        old = self.attacks[sq]
+        old_color = self.colors[sq]
+        piece = self.position.piece_at(sq)
+        if piece is None:
+            (color, new) = (old_color, 0)
+        else:
+            color = piece[0]
+            new = attacks(color, piece[1], sq, self.position.all_occupied())
+        if color == old_color:
+            (removed, added) = (old & ~new, new & ~old)
+        else:
+            (removed, added) = (old, new)
+        bit = 1 << sq
+        attackers = self.attackers[old_color]
+        for target in iter_squares(removed):
+            attackers[target] &= ~bit
+            if not attackers[target]:
+                self.attacked[old_color] &= ~(1 << target)
+        attackers = self.attackers[color]
+        for target in iter_squares(added):
+            attackers[target] |= bit
+        self.attacked[color] |= added
+        self.attacks[sq] = new
+        self.colors[sq] = color
+
+    def is_attacked(self, sq, color):
+        return (self.attacked[color] >> sq) & 1 == 1
+
+    def attackers_of(self, sq, color):
+        # bitboard of the squares of color's pieces attacking sq
+        return self.attackers[color][sq]
+
+    def attacks_from(self, sq):
+        return self.attacks[sq]
+
+    def attacked_squares(self, color):
+        return self.attacked[color]
+
+    def in_check(self, color):
+        return self.is_attacked(self.position.king_square(color), 1 - color)
+
+    def check(self):
+        # Compares the map with one built from scratch, raises AssertionError on the
+        # first difference.
+        fresh = AttackMap(self.position)
+        for sq in range(64):
+            if self.attacks[sq] != fresh.attacks[sq]:
+                raise AssertionError(f"attack map: attacks from square {sq} are {self.attacks[sq]:#x}, "
+                                     f"expected {fresh.attacks[sq]:#x}")
+            for color in (0, 1):
+                if self.attackers[color][sq] != fresh.attackers[color][sq]:
+                    raise AssertionError(f"attack map: attackers of square {sq} for color {color} are "
+                                         f"{self.attackers[color][sq]:#x}, "
+                                         f"expected {fresh.attackers[color][sq]:#x}")
+        if self.attacked != fresh.attacked:
+            raise AssertionError("attack map: attacked squares differ from a full recomputation")
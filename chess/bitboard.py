@@ -0,0 +1,764 @@
+from array import array
+
+from chess.pieces import Pawn, Rook, Knight, Bishop, Queen, King
+from chess.zobrist import PIECE_KEYS, CASTLING_KEYS, EP_KEYS, TURN_KEY
+from chess.evaluation import MG_SCORES, EG_SCORES, PHASE_WEIGHTS
+
+# Squares are numbered row * 8 + col, so square 0 is (0, 0) (white's queen rook corner)
+# and square 63 is (7, 7). Every set of squares is a 64-bit python int.
+WHITE, BLACK = 0, 1
+COLOR_NAMES = ('white', 'black')
+COLORS = {'white': WHITE, 'black': BLACK}
+
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PIECE_CLASSES = (Pawn, Knight, Bishop, Rook, Queen, King)
+PIECE_TYPES = {cls: piece_type for piece_type, cls in enumerate(PIECE_CLASSES)}
+
+FULL = (1 << 64) - 1
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+RANK_1 = 0xFF
+RANK_8 = RANK_1 << 56
+
+
+def square(row, col):
+    return row * 8 + col
+
+def coords(sq):
+    return divmod(sq, 8)
+
+def lsb(bb):
+    return (bb & -bb).bit_length() - 1
+
+def msb(bb):
+    return bb.bit_length() - 1
+
+def iter_squares(bb):
+    while bb:
+        bit = bb & -bb
+        yield bit.bit_length() - 1
+        bb ^= bit
+
+def popcount(bb):
+    return bin(bb).count('1')
+
+
+# Moves are 16-bit ints: from square (bits 0-5), to square (bits 6-11), promotion piece
+# type (bits 12-14, 0 when the move is not a promotion) and a flag (bit 15) set on
+# castling and en-passant moves. Move lists are array('H') of these.
+SPECIAL = 1 << 15
+
+def encode_move(from_sq, to_sq, promotion=0, special=False):
+    return from_sq | (to_sq << 6) | (promotion << 12) | (SPECIAL if special else 0)
+
+def move_from(move):
+    return move & 63
+
+def move_to(move):
+    return (move >> 6) & 63
+
+def move_promotion(move):
+    return (move >> 12) & 7
+
+def is_special(move):
+    return move & SPECIAL != 0
+
+PIECE_LETTERS = 'pnbrqk'
+
+def square_name(sq):
+    return 'abcdefgh'[sq & 7] + str((sq >> 3) + 1)
+
+def parse_square(name):
+    return square(int(name[1]) - 1, 'abcdefgh'.index(name[0]))
+
+def move_to_uci(move):
+    name = square_name(move & 63) + square_name((move >> 6) & 63)
+    if (move >> 12) & 7:
+        name += PIECE_LETTERS[(move >> 12) & 7]
+    return name
+
+
+# Castling rights are four bits. CASTLING_MASK[sq] clears the rights that are lost when
+# a piece moves from or to sq (the king and rook starting squares).
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+ALL_CASTLING = 15
+CASTLING_LETTERS = {'K': WHITE_KINGSIDE, 'Q': WHITE_QUEENSIDE, 'k': BLACK_KINGSIDE, 'q': BLACK_QUEENSIDE}
+CASTLING_MASK = [ALL_CASTLING] * 64
+CASTLING_MASK[0] ^= WHITE_QUEENSIDE
+CASTLING_MASK[7] ^= WHITE_KINGSIDE
+CASTLING_MASK[4] ^= WHITE_KINGSIDE | WHITE_QUEENSIDE
+CASTLING_MASK[56] ^= BLACK_QUEENSIDE
+CASTLING_MASK[63] ^= BLACK_KINGSIDE
+CASTLING_MASK[60] ^= BLACK_KINGSIDE | BLACK_QUEENSIDE
+
+# (right, king from, king to, rook from, rook to, squares that must be empty,
+#  squares the king crosses) for each castling move.
+CASTLING_MOVES = (
+    (WHITE_KINGSIDE, 4, 6, 7, 5, 0x60, (4, 5, 6)),
+    (WHITE_QUEENSIDE, 4, 2, 0, 3, 0x0E, (4, 3, 2)),
+    (BLACK_KINGSIDE, 60, 62, 63, 61, 0x60 << 56, (60, 61, 62)),
+    (BLACK_QUEENSIDE, 60, 58, 56, 59, 0x0E << 56, (60, 59, 58)),
+)
+# Rook from and to squares keyed by the king's destination.
+CASTLING_ROOKS = {king_to: (rook_from, rook_to) for (_, _, king_to, rook_from, rook_to, _, _) in CASTLING_MOVES}
+# a1 is a dark square.
+DARK_SQUARES = sum(1 << sq for sq in range(64) if (sq // 8 + sq % 8) % 2 == 0)
+
+
+def _step_table(steps):
+    table = []
+    for sq in range(64):
+        row, col = coords(sq)
+        bb = 0
+        for (dr, dc) in steps:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                bb |= 1 << square(r, c)
+        table.append(bb)
+    return table
+
+KNIGHT_ATTACKS = _step_table([(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)])
+KING_ATTACKS = _step_table([(1, 1), (1, 0), (1, -1), (0, 1), (0, -1), (-1, 1), (-1, 0), (-1, -1)])
+PAWN_ATTACKS = (_step_table([(1, 1), (1, -1)]), _step_table([(-1, 1), (-1, -1)]))
+
+# Rays run from a square up to the edge of the board, the square itself excluded.
+# The first four directions increase the square index, so the nearest blocker on them
+# is the lowest set bit; on the last four it is the highest set bit.
+NORTH, EAST, NORTH_EAST, NORTH_WEST, SOUTH, WEST, SOUTH_WEST, SOUTH_EAST = range(8)
+DIRECTIONS = [(1, 0), (0, 1), (1, 1), (1, -1), (-1, 0), (0, -1), (-1, -1), (-1, 1)]
+
+def _ray_table(dr, dc):
+    table = []
+    for sq in range(64):
+        row, col = coords(sq)
+        bb = 0
+        r, c = row + dr, col + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            bb |= 1 << square(r, c)
+            r, c = r + dr, c + dc
+        table.append(bb)
+    return table
+
+RAYS = [_ray_table(dr, dc) for (dr, dc) in DIRECTIONS]
+
+# BETWEEN[a][b] holds the squares strictly between two squares on a common line and
+# LINE[a][b] the whole line through both of them (0 when they are not aligned).
+def _line_tables():
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+    for a in range(64):
+        for direction in range(8):
+            opposite = (direction + 4) % 8
+            for b in iter_squares(RAYS[direction][a]):
+                between[a][b] = RAYS[direction][a] & ~RAYS[direction][b] & ~(1 << b)
+                line[a][b] = RAYS[direction][a] | RAYS[opposite][a] | (1 << a)
+    return (between, line)
+
+BETWEEN, LINE = _line_tables()
+
+def _slider_attacks(sq, occupied, positive, negative):
+    attacks = 0
+    for direction in positive:
+        ray = RAYS[direction][sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= RAYS[direction][lsb(blockers)]
+        attacks |= ray
+    for direction in negative:
+        ray = RAYS[direction][sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= RAYS[direction][msb(blockers)]
+        attacks |= ray
+    return attacks
+
+def bishop_attacks(sq, occupied):
+    return _slider_attacks(sq, occupied, (NORTH_EAST, NORTH_WEST), (SOUTH_WEST, SOUTH_EAST))
+
+def rook_attacks(sq, occupied):
+    return _slider_attacks(sq, occupied, (NORTH, EAST), (SOUTH, WEST))
+
+def queen_attacks(sq, occupied):
+    return _slider_attacks(sq, occupied, (NORTH, EAST, NORTH_EAST, NORTH_WEST),
+                            (SOUTH, WEST, SOUTH_WEST, SOUTH_EAST))
+
+def attacks(color, piece_type, sq, occupied):
+    if piece_type == PAWN:
+        return PAWN_ATTACKS[color][sq]
+    elif piece_type == KNIGHT:
+        return KNIGHT_ATTACKS[sq]
+    elif piece_type == BISHOP:
+        return bishop_attacks(sq, occupied)
+    elif piece_type == ROOK:
+        return rook_attacks(sq, occupied)
+    elif piece_type == QUEEN:
+        return queen_attacks(sq, occupied)
+    else:
+        return KING_ATTACKS[sq]
+
+
+MAILBOX_PIECES = [None] + [(color, piece_type) for color in (WHITE, BLACK) for piece_type in range(6)]
+NO_PIECE = 7
+NO_SQUARE = 64
+
+
+class BitboardPosition:
+    def __init__(self):
+        self.pieces = [[0] * 6, [0] * 6]
+        self.occupied = [0, 0]
+        self.turn = WHITE
+        self.castling = 0
+        self.ep_square = None
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        # Zobrist key of the position, kept up to date by every method that changes it.
+        self.key = 0
+        # 1 + color * 6 + piece type for every square, 0 when empty.
+        self.mailbox = bytearray(64)
+        # Piece-square sums (white minus black) and game phase for the evaluation,
+        # kept up to date like the key.
+        self.mg = 0
+        self.eg = 0
+        self.phase = 0
+        # One packed undo record per made move (see make_move) and the key before it.
+        self.undo_stack = array('Q')
+        self.key_history = array('Q')
+
+    @classmethod
+    def from_board(cls, board, turn='white'):
+        position = cls()
+        for row in range(8):
+            for col in range(8):
+                piece = board[row][col]
+                if piece is not None:
+                    position.put_piece(square(row, col), COLORS[piece.color], PIECE_TYPES[type(piece)])
+        position.turn = COLORS[turn]
+        # Without a move history, castling is allowed while king and rook are at home.
+        position.castling = position.__rights_at_home()
+        position.key = position.compute_key()
+        return position
+
+    def __rights_at_home(self):
+        # The castling rights whose king and rook stand on their starting squares.
+        rights = 0
+        for (right, king_from, _, rook_from, _, _, _) in CASTLING_MOVES:
+            color = WHITE if king_from == 4 else BLACK
+            if self.pieces[color][KING] >> king_from & self.pieces[color][ROOK] >> rook_from & 1:
+                rights |= right
+        return rights
+
+    @classmethod
+    def from_fen(cls, fen):
+        # Raises ValueError on anything that is not a legal FEN board with one king per
+        # side. The fields after the board are optional, as in EPD, but the two move
+        # counters come together.
+        fields = fen.split()
+        if not fields or len(fields) == 5 or len(fields) > 6:
+            raise ValueError(f"bad FEN {fen!r}: expected 6 fields (or the first 1 to 4)")
+        ranks = fields[0].split('/')
+        if len(ranks) != 8:
+            raise ValueError(f"bad FEN {fen!r}: expected 8 ranks, got {len(ranks)}")
+        position = cls()
+        for (i, rank) in enumerate(ranks):
+            row = 7 - i
+            col = 0
+            for char in rank:
+                if char in '12345678':
+                    col += int(char)
+                elif char.lower() not in PIECE_LETTERS:
+                    raise ValueError(f"bad FEN {fen!r}: unknown piece {char!r}")
+                elif col < 8:
+                    color = WHITE if char.isupper() else BLACK
+                    position.put_piece(square(row, col), color, PIECE_LETTERS.index(char.lower()))
+                    col += 1
+                else:
+                    col = 9
+                    break
+            if col != 8:
+                raise ValueError(f"bad FEN {fen!r}: rank {8 - i} does not have 8 squares")
+        for color in (WHITE, BLACK):
+            if popcount(position.pieces[color][KING]) != 1:
+                raise ValueError(f"bad FEN {fen!r}: {COLOR_NAMES[color]} needs exactly one king")
+        if (position.pieces[WHITE][PAWN] | position.pieces[BLACK][PAWN]) & (RANK_1 | RANK_8):
+            raise ValueError(f"bad FEN {fen!r}: pawns on the first or last rank")
+        if len(fields) > 1 and fields[1] not in ('w', 'b'):
+            raise ValueError(f"bad FEN {fen!r}: side to move must be 'w' or 'b'")
+        position.turn = WHITE if len(fields) < 2 or fields[1] == 'w' else BLACK
+        if len(fields) > 2 and fields[2] != '-':
+            for char in fields[2]:
+                if char not in CASTLING_LETTERS:
+                    raise ValueError(f"bad FEN {fen!r}: unknown castling right {char!r}")
+                position.castling |= CASTLING_LETTERS[char]
+            # a right whose king or rook has left home cannot be used, drop it
+            position.castling &= position.__rights_at_home()
+        if len(fields) > 3 and fields[3] != '-':
+            if len(fields[3]) != 2 or fields[3][0] not in 'abcdefgh' or fields[3][1] not in '36':
+                raise ValueError(f"bad FEN {fen!r}: bad en passant square {fields[3]!r}")
+            ep_square = parse_square(fields[3])
+            # only kept when a pawn can actually take, as make_move does
+            if PAWN_ATTACKS[1 - position.turn][ep_square] & position.pieces[position.turn][PAWN]:
+                position.ep_square = ep_square
+        if len(fields) > 5:
+            if not (fields[4].isdigit() and fields[5].isdigit()):
+                raise ValueError(f"bad FEN {fen!r}: move counters must be non-negative integers")
+            position.halfmove_clock = int(fields[4])
+            position.fullmove_number = int(fields[5])
+        if position.in_check(1 - position.turn):
+            raise ValueError(f"bad FEN {fen!r}: the side not to move is in check")
+        position.key = position.compute_key()
+        return position
+
+    def to_fen(self):
+        ranks = []
+        for row in range(7, -1, -1):
+            rank = ''
+            empty = 0
+            for col in range(8):
+                found = self.piece_at(square(row, col))
+                if found is None:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                (color, piece_type) = found
+                letter = PIECE_LETTERS[piece_type]
+                rank += letter.upper() if color == WHITE else letter
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        castling = ''.join(letter for letter in 'KQkq' if self.castling & CASTLING_LETTERS[letter]) or '-'
+        ep_square = square_name(self.ep_square) if self.ep_square is not None else '-'
+        return ' '.join(['/'.join(ranks), 'w' if self.turn == WHITE else 'b', castling, ep_square,
+                         str(self.halfmove_clock), str(self.fullmove_number)])
+
+    def copy(self):
+        position = BitboardPosition()
+        position.pieces = [self.pieces[WHITE][:], self.pieces[BLACK][:]]
+        position.occupied = self.occupied[:]
+        position.turn = self.turn
+        position.castling = self.castling
+        position.ep_square = self.ep_square
+        position.halfmove_clock = self.halfmove_clock
+        position.fullmove_number = self.fullmove_number
+        position.key = self.key
+        position.mailbox = self.mailbox[:]
+        position.mg = self.mg
+        position.eg = self.eg
+        position.phase = self.phase
+        position.undo_stack = self.undo_stack[:]
+        position.key_history = self.key_history[:]
+        return position
+
+    def all_occupied(self):
+        return self.occupied[WHITE] | self.occupied[BLACK]
+
+    def compute_key(self):
+        key = CASTLING_KEYS[self.castling]
+        for color in (WHITE, BLACK):
+            for piece_type in range(6):
+                for sq in iter_squares(self.pieces[color][piece_type]):
+                    key ^= PIECE_KEYS[color][piece_type][sq]
+        if self.ep_square is not None:
+            key ^= EP_KEYS[self.ep_square & 7]
+        if self.turn == WHITE:
+            key ^= TURN_KEY
+        return key
+
+    def compute_scores(self):
+        # (mg, eg, phase) from scratch, to check the incremental values.
+        mg = eg = phase = 0
+        for sq in range(64):
+            if self.mailbox[sq]:
+                (color, piece_type) = MAILBOX_PIECES[self.mailbox[sq]]
+                mg += MG_SCORES[color][piece_type][sq]
+                eg += EG_SCORES[color][piece_type][sq]
+                phase += PHASE_WEIGHTS[piece_type]
+        return (mg, eg, phase)
+
+    def set_turn(self, color):
+        if color != self.turn:
+            self.turn = color
+            self.key ^= TURN_KEY
+
+    def put_piece(self, sq, color, piece_type):
+        bit = 1 << sq
+        self.pieces[color][piece_type] |= bit
+        self.occupied[color] |= bit
+        self.key ^= PIECE_KEYS[color][piece_type][sq]
+        self.mailbox[sq] = 1 + color * 6 + piece_type
+        self.mg += MG_SCORES[color][piece_type][sq]
+        self.eg += EG_SCORES[color][piece_type][sq]
+        self.phase += PHASE_WEIGHTS[piece_type]
+
+    def remove_piece(self, sq):
+        found = self.piece_at(sq)
+        if found is not None:
+            color, piece_type = found
+            mask = FULL ^ (1 << sq)
+            self.pieces[color][piece_type] &= mask
+            self.occupied[color] &= mask
+            self.key ^= PIECE_KEYS[color][piece_type][sq]
+            self.mailbox[sq] = 0
+            self.mg -= MG_SCORES[color][piece_type][sq]
+            self.eg -= EG_SCORES[color][piece_type][sq]
+            self.phase -= PHASE_WEIGHTS[piece_type]
+        return found
+
+    def piece_at(self, sq):
+        code = self.mailbox[sq]
+        return MAILBOX_PIECES[code] if code else None
+
+    def piece_type_at(self, sq):
+        # piece type on sq, -1 when it is empty
+        return (self.mailbox[sq] - 1) % 6 if self.mailbox[sq] else -1
+
+    def attackers(self, color, sq, occupied=None):
+        if occupied is None:
+            occupied = self.all_occupied()
+        pieces = self.pieces[color]
+        queens = pieces[QUEEN]
+        return ((PAWN_ATTACKS[1 - color][sq] & pieces[PAWN])
+                | (KNIGHT_ATTACKS[sq] & pieces[KNIGHT])
+                | (KING_ATTACKS[sq] & pieces[KING])
+                | (bishop_attacks(sq, occupied) & (pieces[BISHOP] | queens))
+                | (rook_attacks(sq, occupied) & (pieces[ROOK] | queens)))
+
+    def is_attacked(self, sq, by_color):
+        return self.attackers(by_color, sq) != 0
+
+    def king_square(self, color):
+        return lsb(self.pieces[color][KING])
+
+    def in_check(self, color=None):
+        if color is None:
+            color = self.turn
+        return self.is_attacked(self.king_square(color), 1 - color)
+
+    def pawn_pushes(self, color, sq):
+        empty = FULL ^ self.all_occupied()
+        if color == WHITE:
+            single = (1 << (sq + 8)) & empty if sq < 56 else 0
+            double = (single << 8) & empty if single and sq < 16 else 0
+        else:
+            single = (1 << (sq - 8)) & empty if sq >= 8 else 0
+            double = (single >> 8) & empty if single and sq >= 48 else 0
+        return single | double
+
+    def moves_from(self, sq):
+        # Target squares of the piece on sq: empty squares it can reach and enemy pieces
+        # it can capture.
+        color, piece_type = self.piece_at(sq)
+        enemies = self.occupied[1 - color]
+        if piece_type == PAWN:
+            return self.pawn_pushes(color, sq) | (PAWN_ATTACKS[color][sq] & enemies)
+        return attacks(color, piece_type, sq, self.all_occupied()) & ~self.occupied[color]
+
+    def generate_moves(self):
+        # Pseudo-legal moves for the side to move.
+        color = self.turn
+        own = self.occupied[color]
+        enemies = self.occupied[1 - color]
+        occupied = own | enemies
+        empty = FULL ^ occupied
+        pieces = self.pieces[color]
+        moves = array('H')
+
+        promotion_rank = RANK_8 if color == WHITE else RANK_1
+        for from_sq in iter_squares(pieces[PAWN]):
+            bit = 1 << from_sq
+            if color == WHITE:
+                single = (bit << 8) & empty
+                double = ((single << 8) & empty) if from_sq < 16 else 0
+            else:
+                single = (bit >> 8) & empty
+                double = ((single >> 8) & empty) if from_sq >= 48 else 0
+            targets = single | double | (PAWN_ATTACKS[color][from_sq] & enemies)
+            for to_sq in iter_squares(targets):
+                if (1 << to_sq) & promotion_rank:
+                    for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        moves.append(from_sq | (to_sq << 6) | (promotion << 12))
+                else:
+                    moves.append(from_sq | (to_sq << 6))
+
+        if self.ep_square is not None:
+            for from_sq in iter_squares(PAWN_ATTACKS[1 - color][self.ep_square] & pieces[PAWN]):
+                moves.append(from_sq | (self.ep_square << 6) | SPECIAL)
+
+        not_own = ~own
+        for piece_type in (KNIGHT, BISHOP, ROOK, QUEEN, KING):
+            for from_sq in iter_squares(pieces[piece_type]):
+                if piece_type == KNIGHT:
+                    targets = KNIGHT_ATTACKS[from_sq]
+                elif piece_type == BISHOP:
+                    targets = bishop_attacks(from_sq, occupied)
+                elif piece_type == ROOK:
+                    targets = rook_attacks(from_sq, occupied)
+                elif piece_type == QUEEN:
+                    targets = queen_attacks(from_sq, occupied)
+                else:
+                    targets = KING_ATTACKS[from_sq]
+                for to_sq in iter_squares(targets & not_own):
+                    moves.append(from_sq | (to_sq << 6))
+
+        if self.castling:
+            for (right, king_from, king_to, rook_from, _, between, crossed) in CASTLING_MOVES:
+                # the rights are not trusted blindly, king and rook must be at home
+                if (self.castling & right and not between & occupied and (king_from < 8) == (color == WHITE)
+                        and pieces[KING] >> king_from & pieces[ROOK] >> rook_from & 1):
+                    if not any(self.is_attacked(sq, 1 - color) for sq in crossed):
+                        moves.append(king_from | (king_to << 6) | SPECIAL)
+        return moves
+
+    def pinned(self, color):
+        # Pieces of color that stand alone between their king and an enemy slider.
+        king = self.king_square(color)
+        enemy = self.pieces[1 - color]
+        queens = enemy[QUEEN]
+        snipers = ((rook_attacks(king, 0) & (enemy[ROOK] | queens))
+                   | (bishop_attacks(king, 0) & (enemy[BISHOP] | queens)))
+        occupied = self.all_occupied()
+        pinned = 0
+        for sniper in iter_squares(snipers):
+            blockers = BETWEEN[king][sniper] & occupied
+            if blockers and not blockers & (blockers - 1):
+                pinned |= blockers & self.occupied[color]
+        return pinned
+
+    def legal_moves(self):
+        # Checkers and pins are worked out once, then the pseudo-legal moves are
+        # filtered in one pass. Only en-passant captures, which can uncover a check
+        # along the rank of both pawns, are tried on the board.
+        color = self.turn
+        them = 1 - color
+        king = self.king_square(color)
+        checkers = self.attackers(them, king)
+        if checkers & (checkers - 1):
+            check_mask = 0
+        elif checkers:
+            check_mask = checkers | BETWEEN[king][lsb(checkers)]
+        else:
+            check_mask = FULL
+        pinned = self.pinned(color)
+        without_king = self.all_occupied() ^ (1 << king)
+
+        moves = array('H')
+        for move in self.generate_moves():
+            from_sq = move & 63
+            to_sq = (move >> 6) & 63
+            if from_sq == king:
+                if not self.attackers(them, to_sq, without_king):
+                    moves.append(move)
+            elif move & SPECIAL:
+                self.make_move(move)
+                if not self.in_check(color):
+                    moves.append(move)
+                self.unmake_move()
+            elif (check_mask >> to_sq) & 1 and (not (pinned >> from_sq) & 1 or (LINE[king][from_sq] >> to_sq) & 1):
+                moves.append(move)
+        return moves
+
+    def encode_move(self, from_sq, to_sq, promotion=0):
+        # Packs a move given by its squares, flagging castling and en passant.
+        piece_type = self.piece_type_at(from_sq)
+        special = ((piece_type == KING and to_sq - from_sq in (2, -2))
+                   or (piece_type == PAWN and to_sq == self.ep_square))
+        return encode_move(from_sq, to_sq, promotion, special)
+
+    # Undo records pack the state make_move cannot recompute into one 64-bit int:
+    # move (bits 0-15), moved piece type (16-18), captured piece type (19-21, NO_PIECE
+    # when nothing was taken), castling rights (22-25), en-passant square (26-32,
+    # NO_SQUARE when there is none) and the halfmove clock (33 and up). The key before
+    # the move goes to key_history.
+    def make_move(self, move):
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        promotion = (move >> 12) & 7
+        color = self.turn
+        them = 1 - color
+        pieces = self.pieces[color]
+        mailbox = self.mailbox
+        from_bit = 1 << from_sq
+        to_bit = 1 << to_sq
+
+        piece_type = (mailbox[from_sq] - 1) % 6
+        new_type = promotion or piece_type
+        key = self.key
+        mg = self.mg + MG_SCORES[color][new_type][to_sq] - MG_SCORES[color][piece_type][from_sq]
+        eg = self.eg + EG_SCORES[color][new_type][to_sq] - EG_SCORES[color][piece_type][from_sq]
+        captured = NO_PIECE
+        if mailbox[to_sq]:
+            captured = (mailbox[to_sq] - 1) % 6
+            self.pieces[them][captured] ^= to_bit
+            self.occupied[them] ^= to_bit
+            key ^= PIECE_KEYS[them][captured][to_sq]
+            mg -= MG_SCORES[them][captured][to_sq]
+            eg -= EG_SCORES[them][captured][to_sq]
+            self.phase -= PHASE_WEIGHTS[captured]
+        elif move & SPECIAL and piece_type == PAWN:
+            captured = PAWN
+            captured_sq = to_sq - 8 if color == WHITE else to_sq + 8
+            self.pieces[them][PAWN] ^= 1 << captured_sq
+            self.occupied[them] ^= 1 << captured_sq
+            mailbox[captured_sq] = 0
+            key ^= PIECE_KEYS[them][PAWN][captured_sq]
+            mg -= MG_SCORES[them][PAWN][captured_sq]
+            eg -= EG_SCORES[them][PAWN][captured_sq]
+        if promotion:
+            self.phase += PHASE_WEIGHTS[promotion]
+
+        ep_square = self.ep_square
+        self.undo_stack.append(move | (piece_type << 16) | (captured << 19) | (self.castling << 22)
+                               | ((NO_SQUARE if ep_square is None else ep_square) << 26)
+                               | (self.halfmove_clock << 33))
+        self.key_history.append(self.key)
+
+        pieces[piece_type] ^= from_bit
+        pieces[new_type] |= to_bit
+        self.occupied[color] ^= from_bit | to_bit
+        mailbox[from_sq] = 0
+        mailbox[to_sq] = 1 + color * 6 + new_type
+        key ^= PIECE_KEYS[color][piece_type][from_sq] ^ PIECE_KEYS[color][new_type][to_sq]
+
+        new_ep_square = None
+        if piece_type == PAWN:
+            if to_sq - from_sq in (16, -16):
+                middle = (from_sq + to_sq) >> 1
+                if PAWN_ATTACKS[color][middle] & self.pieces[them][PAWN]:
+                    new_ep_square = middle
+            self.halfmove_clock = 0
+        elif captured != NO_PIECE:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+            if move & SPECIAL:
+                (rook_from, rook_to) = CASTLING_ROOKS[to_sq]
+                rook_bits = (1 << rook_from) | (1 << rook_to)
+                pieces[ROOK] ^= rook_bits
+                self.occupied[color] ^= rook_bits
+                mailbox[rook_to] = mailbox[rook_from]
+                mailbox[rook_from] = 0
+                key ^= PIECE_KEYS[color][ROOK][rook_from] ^ PIECE_KEYS[color][ROOK][rook_to]
+                mg += MG_SCORES[color][ROOK][rook_to] - MG_SCORES[color][ROOK][rook_from]
+                eg += EG_SCORES[color][ROOK][rook_to] - EG_SCORES[color][ROOK][rook_from]
+
+        castling = self.castling & CASTLING_MASK[from_sq] & CASTLING_MASK[to_sq]
+        key ^= CASTLING_KEYS[self.castling] ^ CASTLING_KEYS[castling]
+        if ep_square is not None:
+            key ^= EP_KEYS[ep_square & 7]
+        if new_ep_square is not None:
+            key ^= EP_KEYS[new_ep_square & 7]
+        self.castling = castling
+        self.ep_square = new_ep_square
+        if color == BLACK:
+            self.fullmove_number += 1
+        self.turn = them
+        self.key = key ^ TURN_KEY
+        self.mg = mg
+        self.eg = eg
+
+    def unmake_move(self):
+        record = self.undo_stack.pop()
+        self.key = self.key_history.pop()
+        move = record & 0xFFFF
+        piece_type = (record >> 16) & 7
+        captured = (record >> 19) & 7
+        self.castling = (record >> 22) & 15
+        ep_square = (record >> 26) & 127
+        self.ep_square = ep_square = None if ep_square == NO_SQUARE else ep_square
+        self.halfmove_clock = record >> 33
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        promotion = (move >> 12) & 7
+        them = self.turn
+        color = 1 - them
+        pieces = self.pieces[color]
+        mailbox = self.mailbox
+        from_bit = 1 << from_sq
+        to_bit = 1 << to_sq
+
+        new_type = promotion or piece_type
+        pieces[new_type] ^= to_bit
+        pieces[piece_type] |= from_bit
+        self.occupied[color] ^= from_bit | to_bit
+        mailbox[from_sq] = 1 + color * 6 + piece_type
+        mailbox[to_sq] = 0
+        mg = self.mg - MG_SCORES[color][new_type][to_sq] + MG_SCORES[color][piece_type][from_sq]
+        eg = self.eg - EG_SCORES[color][new_type][to_sq] + EG_SCORES[color][piece_type][from_sq]
+        if promotion:
+            self.phase -= PHASE_WEIGHTS[promotion]
+
+        if captured != NO_PIECE:
+            captured_sq = to_sq
+            if move & SPECIAL:
+                captured_sq = to_sq - 8 if color == WHITE else to_sq + 8
+            self.pieces[them][captured] |= 1 << captured_sq
+            self.occupied[them] |= 1 << captured_sq
+            mailbox[captured_sq] = 1 + them * 6 + captured
+            mg += MG_SCORES[them][captured][captured_sq]
+            eg += EG_SCORES[them][captured][captured_sq]
+            self.phase += PHASE_WEIGHTS[captured]
+        elif move & SPECIAL:
+            (rook_from, rook_to) = CASTLING_ROOKS[to_sq]
+            rook_bits = (1 << rook_from) | (1 << rook_to)
+            pieces[ROOK] ^= rook_bits
+            self.occupied[color] ^= rook_bits
+            mailbox[rook_from] = mailbox[rook_to]
+            mailbox[rook_to] = 0
+            mg -= MG_SCORES[color][ROOK][rook_to] - MG_SCORES[color][ROOK][rook_from]
+            eg -= EG_SCORES[color][ROOK][rook_to] - EG_SCORES[color][ROOK][rook_from]
+
+        if color == BLACK:
+            self.fullmove_number -= 1
+        self.turn = color
+        self.mg = mg
+        self.eg = eg
+
+    def repetitions(self):
+        # How often the current position occurred before. Only positions since the
+        # last capture or pawn move can repeat it, and only every other one has the
+        # same side to move, so at most halfmove_clock / 2 keys are compared.
+        history = self.key_history
+        key = self.key
+        count = 0
+        for index in range(len(history) - 2, max(-1, len(history) - 1 - self.halfmove_clock), -2):
+            if history[index] == key:
+                count += 1
+        return count
+
+    def is_insufficient_material(self):
+        # Neither side can mate: bare kings plus at most one minor piece, or bishops
+        # that all stand on squares of one color.
+        white = self.pieces[WHITE]
+        black = self.pieces[BLACK]
+        if (white[PAWN] | black[PAWN] | white[ROOK] | black[ROOK] | white[QUEEN] | black[QUEEN]):
+            return False
+        knights = white[KNIGHT] | black[KNIGHT]
+        bishops = white[BISHOP] | black[BISHOP]
+        if popcount(knights | bishops) <= 1:
+            return True
+        return not knights and (not bishops & DARK_SQUARES or not bishops & ~DARK_SQUARES)
+
+    def is_draw(self):
+        # Draws a search can stop at without generating moves: fifty-move rule, any
+        # repetition (a repeated position can be forced again) and dead positions.
+        # Stalemate needs the move list and is found by the search itself.
+        return self.halfmove_clock >= 100 or self.repetitions() > 0 or self.is_insufficient_material()
+
+    def outcome(self):
+        # None while the game goes on, otherwise {"result": "1-0" / "0-1" / "1/2-1/2",
+        # "reason": ...} by the rules of the game (threefold repetition).
+        if not self.legal_moves():
+            if self.in_check():
+                return {"result": "0-1" if self.turn == WHITE else "1-0", "reason": "checkmate"}
+            return {"result": "1/2-1/2", "reason": "stalemate"}
+        if self.is_insufficient_material():
+            return {"result": "1/2-1/2", "reason": "insufficient material"}
+        if self.halfmove_clock >= 100:
+            return {"result": "1/2-1/2", "reason": "fifty-move rule"}
+        if self.repetitions() >= 2:
+            return {"result": "1/2-1/2", "reason": "threefold repetition"}
+        return None
+
+    def is_game_over(self):
+        return self.outcome() is not None
@@ -1,10 +1,10 @@
-from chess.pieces import Pawn, Rook, Knight, Bishop, Queen, King
+from chess.position import Position
+from chess.render import SpriteAtlas
 import pygame
-import os.path
 
-class Board:
-    def __init__(self):
-        self.board = self.__create_board()
+class Board(Position):
+    def __init__(self, fen=None):
+        super().__init__(fen)
 
         self.square_size = 80  # Size of each square on the chessboard
         self.window_size = self.square_size * 8
@@ -14,365 +14,33 @@ class Board:
 
         self.colors = [pygame.Color(255, 206, 158), pygame.Color(209, 139, 71)]  # Light and dark squares
 
-        self.pieces_blocking_map = self.__initialize_blocking_map()
-        self.pieces_move_map = self.__initialize_move_map()
-
-        self.update_legal_moves()
-    def __create_board(self):
-        board = [[None for _ in range(8)] for _ in range(8)]
-        self.__setup_pieces(board)
-        return board
-    def __setup_pieces(self, board):
-        # Initialize pawns
-        for i in range(8):
-            board[1][i] = Pawn('white', (1, i))
-            board[6][i] = Pawn('black', (6, i))
-
-        # Initialize other pieces
-        placement = [Rook, Knight, Bishop, Queen, King, Bishop, Knight, Rook]
-        for i, piece in enumerate(placement):
-            board[0][i] = piece('white', (0, i))
-            board[7][i] = piece('black', (7, i))
-    def __initialize_blocking_map(self):
-        map = {}
-        for i in range(8):
-            for j in range(8):
-                piece = self.board[i][j]
-                if piece is not None:
-                    blocked_pieces = self.close_out(piece)
-                    map[piece] = set(blocked_pieces)
-        return map
-    def __initialize_move_map(self):
-        map = {}
-        for i in range(8):
-            for j in range(8):
-                piece = self.board[i][j]
-                if piece is not None:
-                    result = self.get_free_spots_and_blocking(piece)
-                    free_spots = result[0]
-                    map[piece] = free_spots
-        return map
-
-
-    def __draw_board(self):
-        for row in range(8):
-            for col in range(8):
-                color = self.colors[(row + col) % 2]
-                pygame.draw.rect(self.window, color,
-                                 pygame.Rect(col * self.square_size, row * self.square_size, self.square_size,
-                                             self.square_size))
-                piece = self.board[row][col]
-                if piece:
-                    self.__draw_piece(piece, col, row)
-    def __draw_piece(self, piece, col, row):
-        # You need to add images for each piece (e.g., "white_pawn.png", "black_queen.png", etc.)
-        piece_image = pygame.image.load(f'chess\images\{piece.color}_{piece.__class__.__name__.lower()}.png')
-        piece_image = pygame.transform.scale(piece_image, (self.square_size, self.square_size))
-        self.window.blit(piece_image, (col * self.square_size, row * self.square_size))
+        self.atlas = SpriteAtlas(self.square_size)
+        self.full_redraw = True
+        self.legal_move_spots = set()
+
+    def __draw_square(self, row, col):
+        rect = pygame.Rect(col * self.square_size, row * self.square_size, self.square_size, self.square_size)
+        pygame.draw.rect(self.window, self.colors[(row + col) % 2], rect)
+        piece = self.board[row][col]
+        if piece:
+            self.window.blit(self.atlas.piece(piece), rect)
+        if (row, col) in self.legal_move_spots:
+            self.window.blit(self.atlas.legal_move_spot, rect)
+        return rect
     def display(self):
-        self.__draw_board()
-
-
-    def close_out(self, piece):
-        (free_spots, blocking_pieces) = self.__get_free_spots_and_blocking_DIAGONAL(piece)
-        result = self.__get_free_spots_and_blocking_STRAIGHT(piece)
-        blocking_pieces += result[1]
-        result = self.__get_free_spots_and_blocking_L(piece)
-        blocking_pieces += result[1]
-        return blocking_pieces
-    def get_free_spots_and_blocking(self, piece):
-        if isinstance(piece, Bishop) or isinstance(piece, Queen):
-            (free_spots, blocking_pieces) = self.__get_free_spots_and_blocking_DIAGONAL(piece)
-            if isinstance(piece, Queen):
-                result = self.__get_free_spots_and_blocking_STRAIGHT(piece)
-                free_spots += result[0]
-                blocking_pieces += result[1]
-            return (free_spots, blocking_pieces)
-        elif isinstance(piece, Rook) or isinstance(piece, Queen):
-            (free_spots, blocking_pieces) = self.__get_free_spots_and_blocking_STRAIGHT(piece)
-            if isinstance(piece, Queen):
-                result = self.__get_free_spots_and_blocking_DIAGONAL(piece)
-                free_spots += result[0]
-                blocking_pieces += result[1]
-            return (free_spots, blocking_pieces)
-        elif isinstance(piece, Knight):
-            return self.__get_free_spots_and_blocking_L(piece)
-        elif isinstance(piece, Pawn):
-            return self.__get_free_spots_and_blocking_Pawn(piece)
-        elif isinstance(piece, King):
-            return self.__get_free_spots_and_blocking_King(piece)
+        # Redraws the squares changed since the last call (everything on the first call)
+        # and returns their rects for pygame.display.update.
+        if self.full_redraw:
+            squares = [(row, col) for row in range(8) for col in range(8)]
+            self.full_redraw = False
         else:
-            print("No valid piece")
-            return None
-    def __get_free_spots_and_blocking_DIAGONAL(self, piece):
-        free_spots = []
-        blocking_pieces = []
-        i, j = piece.position
-        #diagonal UP /
-        for k in range(1, min(7 - i, j) + 1):
-            spot = self.board[i + k][j - k]
-            if spot is None:
-                free_spots.append((i + k, j - k))
-            if spot is not None:
-                blocking_pieces.append(spot)
-                break
-        for k in range(1, min(i, 7 - j)):
-            spot = self.board[i - k][j + k]
-            if spot is None:
-                free_spots.append((i - k, j + k))
-            if spot is not None:
-                blocking_pieces.append(spot)
-                break
-        #diagonal DOWN \
-        for k in range(1, min(i, j) + 1):
-            spot = self.board[i - k][j - k]
-            if spot is None:
-                free_spots.append((i - k, j - k))
-            if spot is not None:
-                blocking_pieces.append(spot)
-                break
-        for k in range(1, min(8 - i, 8 - j)):
-            spot = self.board[i + k][j + k]
-            if spot is None:
-                free_spots.append((i + k, j + k))
-            if spot is not None:
-                blocking_pieces.append(spot)
-                break
-        return (free_spots, blocking_pieces)
-    def __get_free_spots_and_blocking_STRAIGHT(self, piece):
-        free_spots = []
-        blocking_pieces = []
-        i, j = piece.position
-        #straight horizontal
-        for k in range(1, j + 1):
-            spot = self.board[i][j - k]
-            if spot is None:
-                free_spots.append((i, j - k))
-            if spot is not None:
-                blocking_pieces.append(spot)
-                break
-        for k in range(1, 8 - j):
-            spot = self.board[i][j + k]
-            if spot is None:
-                free_spots.append((i, j + k))
-            if spot is not None:
-                blocking_pieces.append(spot)
-                break
-
-        #straight vertical
-        for k in range(1, i + 1):
-            spot = self.board[i - k][j]
-            if spot is None:
-                free_spots.append((i - k, j))
-            if spot is not None:
-                blocking_pieces.append(spot)
-                break
-        for k in range(1, 8 - i):
-            spot = self.board[i + k][j]
-            if spot is None:
-                free_spots.append((i + k, j))
-            if spot is not None:
-                blocking_pieces.append(spot)
-                break
-        return (free_spots, blocking_pieces)
-    def __get_free_spots_and_blocking_L(self, piece):
-        free_spots = []
-        blocking_pieces = []
-        i, j = piece.position
-        if (i - 2) >= 0:
-            if (j - 1) >= 0:
-                spot = self.board[i - 2][j - 1]
-                if spot is None:
-                    free_spots.append((i - 2, j - 1))
-                if spot is not None:
-                    blocking_pieces.append(spot)
-            if (j + 1 < 8):
-                spot = self.board[i - 2][j + 1]
-                if spot is None:
-                    free_spots.append((i - 2, j + 1))
-                if spot is not None:
-                    blocking_pieces.append(spot)
-        if (i - 1) >= 0:
-            if (j - 2) >= 0:
-                spot = self.board[i - 1][j - 2]
-                if spot is None:
-                    free_spots.append((i - 1, j - 2))
-                if spot is not None:
-                    blocking_pieces.append(spot)
-            if (j + 2 < 8):
-                spot = self.board[i - 1][j + 2]
-                if spot is None:
-                    free_spots.append((i - 1, j + 2))
-                if spot is not None:
-                    blocking_pieces.append(spot)
-        if (i + 1) < 8:
-            if (j - 2) >= 0:
-                spot = self.board[i + 1][j - 2]
-                if spot is None:
-                    free_spots.append((i + 1, j + 2))
-                if spot is not None:
-                    blocking_pieces.append(spot)
-            if (j + 2 < 8):
-                spot = self.board[i + 1][j + 2]
-                if spot is None:
-                    free_spots.append((i + 1, j + 2))
-                if spot is not None:
-                    blocking_pieces.append(spot)
-        if (i + 2) < 8:
-            if (j - 1) >= 0:
-                spot = self.board[i + 2][j - 1]
-                if spot is None:
-                    free_spots.append((i + 2, j - 1))
-                if spot is not None:
-                    blocking_pieces.append(spot)
-            if (j + 1 < 8):
-                spot = self.board[i + 2][j + 1]
-                if spot is None:
-                    free_spots.append((i + 2, j + 1))
-                if spot is not None:
-                    blocking_pieces.append(spot)
-        return (free_spots, blocking_pieces)
-    def __get_free_spots_and_blocking_Pawn(self, piece):
-        free_spots = []
-        blocking_pieces = []
-        i, j = piece.position
-        if piece.color == 'white':
-            spot = self.board[i + 1][j]
-            if spot is None:
-                free_spots.append((i + 1, j))
-                if piece.first_move:
-                    spot = self.board[i + 2][j]
-                    if spot is None:
-                        free_spots.append((i + 2, j))
-                    if spot is not None:
-                        blocking_pieces.append(spot)
-            if spot is not None:
-                blocking_pieces.append(spot)
-        else:
-            spot = self.board[i - 1][j]
-            if spot is None:
-                free_spots.append((i - 1, j))
-                if piece.first_move:
-                    spot = self.board[i - 2][j]
-                    if spot is None:
-                        free_spots.append((i - 2, j))
-                    if spot is not None:
-                        blocking_pieces.append(spot)
-            if spot is not None:
-                blocking_pieces.append(spot)
-        return (free_spots, blocking_pieces)
-    def __get_free_spots_and_blocking_King(self, piece):
-        free_spots = []
-        blocking_pieces = []
-        i, j = piece.position
-        if i - 1 >= 0:
-            if j - 1 >= 0:
-                spot = self.board[i - 1][j - 1]
-                if spot is None:
-                    free_spots.append((i - 1, j - 1))
-                if spot is not None:
-                    blocking_pieces.append(spot)
-
-                spot = self.board[i][j - 1]
-                if spot is None:
-                    free_spots.append((i, j - 1))
-                if spot is not None:
-                    blocking_pieces.append(spot)
-            spot = self.board[i - 1][j]
-            if spot is None:
-                free_spots.append((i - 1, j))
-            if spot is not None:
-                blocking_pieces.append(spot)
-            if j + 1 < 8:
-                spot = self.board[i - 1][j + 1]
-                if spot is None:
-                    free_spots.append((i - 1, j + 1))
-                if spot is not None:
-                    blocking_pieces.append(spot)
-                spot = self.board[i][j + 1]
-                if spot is None:
-                    free_spots.append((i, j + 1))
-                if spot is not None:
-                    blocking_pieces.append(spot)
-        if i + 1 < 8:
-            if j - 1 >= 0:
-                spot = self.board[i + 1][j - 1]
-                if spot is None:
-                    free_spots.append((i + 1, j - 1))
-                if spot is not None:
-                    blocking_pieces.append(spot)
-            spot = self.board[i + 1][j]
-            if spot is None:
-                free_spots.append((i + 1, j))
-            if spot is not None:
-                blocking_pieces.append(spot)
-            if j + 1 < 8:
-                spot = self.board[i + 1][j + 1]
-                if spot is None:
-                    free_spots.append((i + 1, j + 1))
-                if spot is not None:
-                    blocking_pieces.append(spot)
-        return (free_spots, blocking_pieces)
-
-
-    def process_move(self, player, move):
-        piece = move["piece"]
-        new_spot = move["to_spot"]
-        i, j = piece.position
-
-        old_pieces_blocked_by_piece = self.pieces_blocking_map[piece]
-
-        self.board[i][j] = None
-        if self.board[new_spot[0]][new_spot[1]] is not None:
-            piece_to_capture = self.board[new_spot[0]][new_spot[1]]
-            self.pieces_move_map.pop(piece_to_capture, None)
-            self.board[new_spot[0]][new_spot[1]] = piece
-
-            #DELETE uit blocking map
-        else:
-            self.board[new_spot[0]][new_spot[1]] = piece
-        piece.update_position(new_spot)
-
-        if isinstance(piece, Pawn):
-            piece.first_move_done()
-
-        new_pieces_blocked_by_piece = self.close_out(piece)
-        all_impacted_pieces = old_pieces_blocked_by_piece.union(set(new_pieces_blocked_by_piece))
-
-        self.pieces_blocking_map[piece] = set(new_pieces_blocked_by_piece)
-
-        for impacted_piece in all_impacted_pieces:
-            (free_spots, blocking_pieces) = self.get_free_spots_and_blocking(impacted_piece)
-            for blocking_piece in blocking_pieces:
-                if blocking_piece.color == impacted_piece.color:
-                    self.pieces_blocking_map[blocking_piece].add(impacted_piece)
-                else:
-                    free_spots.append(blocking_piece.position)
-            self.pieces_move_map[impacted_piece] = free_spots
-            impacted_piece.set_legal_moves(free_spots)
-
-
-        (free_spots, blocking_pieces) = self.get_free_spots_and_blocking(piece)
-        for blocking_piece in blocking_pieces:
-            if blocking_piece.color == player:
-                self.pieces_blocking_map[blocking_piece].add(piece)
-            else:
-                free_spots.append(blocking_piece.position)
-        self.pieces_move_map[piece] = free_spots
-        piece.set_legal_moves(free_spots)
-
-
-    def get_piece(self, coords):
-        return self.board[coords[0]][coords[1]]
-
-    def update_legal_moves(self):
-        for piece in self.pieces_move_map.keys():
-            legal_moves = self.pieces_move_map[piece]
-            piece.set_legal_moves(legal_moves)
-
-    def get_game_state(self):
-        game_state = {
-            "legal moves" : self.pieces_move_map,
-            "blocking pieces" : self.pieces_blocking_map
-        }
-        return game_state
\ No newline at end of file
+            squares = self.dirty_squares
+        rects = [self.__draw_square(row, col) for (row, col) in squares]
+        self.dirty_squares = set()
+        return rects
+    def show_legal_move_spots(self, spots):
+        # Markers stay on the given squares until replaced, show_legal_move_spots([])
+        # clears them.
+        self.dirty_squares.update(self.legal_move_spots)
+        self.legal_move_spots = set(spots)
+        self.dirty_squares.update(self.legal_move_spots)
@@ -0,0 +1,157 @@
+import argparse
+import random
+import struct
+import sys
+
+from chess.bitboard import (BitboardPosition, KING, SPECIAL, CASTLING_ROOKS, move_from, move_to, move_promotion,
+                            move_to_uci)
+from chess.fen import RecordFile
+from chess.perft import START_FEN
+from chess.pgn import read_files, parse_san, starting_position
+
+# Polyglot book entries are 16 bytes, big endian, sorted by key:
+#   position key (8 bytes), the same as BitboardPosition.key
+#   move (2 bytes): to file bits 0-2, to rank 3-5, from file 6-8, from rank 9-11,
+#                   promotion piece 12-14 (1 knight ... 4 queen); castling is written
+#                   as the king taking its own rook
+#   weight (2 bytes), learn (4 bytes)
+ENTRY_FORMAT = struct.Struct('>QHHI')
+ENTRY_SIZE = ENTRY_FORMAT.size
+MAX_WEIGHT = 0xFFFF
+
+
+def to_polyglot(position, move):
+    from_sq = move_from(move)
+    to_sq = move_to(move)
+    if move & SPECIAL and position.piece_type_at(from_sq) == KING:
+        to_sq = CASTLING_ROOKS[to_sq][0]
+    return to_sq | (from_sq << 6) | (move_promotion(move) << 12)
+
+def from_polyglot(position, book_move):
+    # Legal move of the position for a book move, 0 when the book is wrong about it.
+    for move in position.legal_moves():
+        if to_polyglot(position, move) == book_move:
+            return move
+    return 0
+
+
+class OpeningBook(RecordFile):
+    # Read-only Polyglot book. The file is memory-mapped and searched in place, so
+    # opening even a large book costs neither time nor resident memory. Indexing gives
+    # the raw (key, move, weight, learn) entries.
+    def __init__(self, path, rng=None):
+        super().__init__(path, ENTRY_SIZE, ENTRY_FORMAT.unpack_from)
+        self.random = rng or random.Random()
+
+    def __first_index(self, key):
+        # Binary search for the first entry with this key (or a larger one).
+        (low, high) = (0, self.count)
+        while low < high:
+            middle = (low + high) // 2
+            if ENTRY_FORMAT.unpack_from(self.data, middle * ENTRY_SIZE)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def entries(self, key):
+        # (polyglot move, weight, learn) of every entry for the key, in file order.
+        found = []
+        index = self.__first_index(key)
+        while index < self.count:
+            (entry_key, move, weight, learn) = ENTRY_FORMAT.unpack_from(self.data, index * ENTRY_SIZE)
+            if entry_key != key:
+                break
+            found.append((move, weight, learn))
+            index += 1
+        return found
+
+    def moves(self, position):
+        # (move, weight) of the legal book moves of a BitboardPosition or Position.
+        if not isinstance(position, BitboardPosition):
+            position = position.bitboard
+        moves = []
+        for (book_move, weight, _) in self.entries(position.key):
+            move = from_polyglot(position, book_move)
+            if move:
+                moves.append((move, weight))
+        return moves
+
+    def choose(self, position):
+        # A book move picked with probability proportional to its weight, 0 when the
+        # position is not in the book.
+        moves = [(move, weight) for (move, weight) in self.moves(position) if weight > 0]
+        if not moves:
+            return 0
+        pick = self.random.randrange(sum(weight for (_, weight) in moves))
+        for (move, weight) in moves:
+            pick -= weight
+            if pick < 0:
+                return move
+        return moves[-1][0]
+
+
+def build_book(pgn_paths, path, max_ply=20, min_count=1):
+    # Writes a Polyglot book of the first max_ply moves of every game. A move's weight
+    # is two points per win and one per draw for the side that played it; moves that
+    # never scored or were played fewer than min_count times are left out. Returns the
+    # number of entries.
+    stats = {}
+    for game in read_files(pgn_paths):
+        result = game["result"]
+        points = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1)}.get(result, (0, 0))
+        try:
+            position = starting_position(game)
+        except ValueError:
+            continue
+        for san in game["moves"][:max_ply]:
+            try:
+                move = parse_san(position, san)
+            except ValueError:
+                break
+            entry = (position.key, to_polyglot(position, move))
+            (count, weight) = stats.get(entry, (0, 0))
+            stats[entry] = (count + 1, weight + points[position.turn])
+            position.make_move(move)
+
+    entries = [(key, move, weight) for ((key, move), (count, weight)) in stats.items()
+               if count >= min_count and weight > 0]
+    largest = max((weight for (_, _, weight) in entries), default=0)
+    scale = MAX_WEIGHT / largest if largest > MAX_WEIGHT else 1
+    # the best moves of a position first, the way Polyglot writes them
+    entries.sort(key=lambda entry: (entry[0], -entry[2]))
+    with open(path, 'wb') as file:
+        for (key, move, weight) in entries:
+            # never round a played move down to zero, zero means "do not play"
+            file.write(ENTRY_FORMAT.pack(key, move, max(1, int(weight * scale)), 0))
+    return len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or probe Polyglot opening books.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build a book from PGN files")
+    build.add_argument("pgn", nargs="+")
+    build.add_argument("-o", "--output", required=True)
+    build.add_argument("--plies", type=int, default=20)
+    build.add_argument("--min-count", type=int, default=1)
+    probe = commands.add_parser("probe", help="list the book moves of a position")
+    probe.add_argument("book")
+    probe.add_argument("--fen", default=START_FEN)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        count = build_book(args.pgn, args.output, args.plies, args.min_count)
+        print(f"{count} entries written to {args.output}")
+    else:
+        position = BitboardPosition.from_fen(args.fen)
+        with OpeningBook(args.book) as book:
+            moves = book.moves(position)
+            total = sum(weight for (_, weight) in moves) or 1
+            for (move, weight) in sorted(moves, key=lambda entry: -entry[1]):
+                print(f"{move_to_uci(move)}  {weight}  {100 * weight / total:.1f}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
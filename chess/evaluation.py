@@ -0,0 +1,172 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Piece values and piece-square tables for the middlegame and the endgame, by piece type
+# (pawn, knight, bishop, rook, queen, king). Tables are written from white's side with
+# the eighth rank on top, the way they read on a diagram.
+MG_VALUES = (100, 320, 330, 500, 900, 0)
+EG_VALUES = (120, 300, 320, 520, 950, 0)
+# Game phase weight of each piece type; 24 with all pieces on the board, 0 in a pawn
+# ending.
+PHASE_WEIGHTS = (0, 1, 1, 2, 4, 0)
+MAX_PHASE = 24
+
+PAWN_TABLE = (
+     0,   0,   0,   0,   0,   0,   0,   0,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    10,  10,  20,  30,  30,  20,  10,  10,
+     5,   5,  10,  25,  25,  10,   5,   5,
+     0,   0,   0,  20,  20,   0,   0,   0,
+     5,  -5, -10,   0,   0, -10,  -5,   5,
+     5,  10,  10, -20, -20,  10,  10,   5,
+     0,   0,   0,   0,   0,   0,   0,   0)
+PAWN_ENDGAME_TABLE = (
+     0,   0,   0,   0,   0,   0,   0,   0,
+    80,  80,  80,  80,  80,  80,  80,  80,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    30,  30,  30,  30,  30,  30,  30,  30,
+    20,  20,  20,  20,  20,  20,  20,  20,
+    10,  10,  10,  10,  10,  10,  10,  10,
+     0,   0,   0,   0,   0,   0,   0,   0,
+     0,   0,   0,   0,   0,   0,   0,   0)
+KNIGHT_TABLE = (
+   -50, -40, -30, -30, -30, -30, -40, -50,
+   -40, -20,   0,   0,   0,   0, -20, -40,
+   -30,   0,  10,  15,  15,  10,   0, -30,
+   -30,   5,  15,  20,  20,  15,   5, -30,
+   -30,   0,  15,  20,  20,  15,   0, -30,
+   -30,   5,  10,  15,  15,  10,   5, -30,
+   -40, -20,   0,   5,   5,   0, -20, -40,
+   -50, -40, -30, -30, -30, -30, -40, -50)
+BISHOP_TABLE = (
+   -20, -10, -10, -10, -10, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,  10,  10,   5,   0, -10,
+   -10,   5,   5,  10,  10,   5,   5, -10,
+   -10,   0,  10,  10,  10,  10,   0, -10,
+   -10,  10,  10,  10,  10,  10,  10, -10,
+   -10,   5,   0,   0,   0,   0,   5, -10,
+   -20, -10, -10, -10, -10, -10, -10, -20)
+ROOK_TABLE = (
+     0,   0,   0,   0,   0,   0,   0,   0,
+     5,  10,  10,  10,  10,  10,  10,   5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+     0,   0,   0,   5,   5,   0,   0,   0)
+QUEEN_TABLE = (
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,   5,   5,   5,   0, -10,
+    -5,   0,   5,   5,   5,   5,   0,  -5,
+     0,   0,   5,   5,   5,   5,   0,  -5,
+   -10,   5,   5,   5,   5,   5,   0, -10,
+   -10,   0,   5,   0,   0,   0,   0, -10,
+   -20, -10, -10,  -5,  -5, -10, -10, -20)
+KING_TABLE = (
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -20, -30, -30, -40, -40, -30, -30, -20,
+   -10, -20, -20, -20, -20, -20, -20, -10,
+    20,  20,   0,   0,   0,   0,  20,  20,
+    20,  30,  10,   0,   0,  10,  30,  20)
+KING_ENDGAME_TABLE = (
+   -50, -40, -30, -20, -20, -30, -40, -50,
+   -30, -20, -10,   0,   0, -10, -20, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -30,   0,   0,   0,   0, -30, -30,
+   -50, -30, -30, -30, -30, -30, -30, -50)
+
+MG_TABLES = (PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_TABLE)
+EG_TABLES = (PAWN_ENDGAME_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_ENDGAME_TABLE)
+
+# Mobility bonus per reachable square, used when a Position's move maps are available.
+MOBILITY_WEIGHT = 4
+
+
+def _square_scores(values, tables):
+    # scores[color][piece_type][square], positive for white and negative for black.
+    # Square 0 is a1, which is the first entry of the table's last line for white; black
+    # reads the table upside down.
+    scores = ([], [])
+    for piece_type in range(6):
+        table = tables[piece_type]
+        scores[0].append([values[piece_type] + table[sq ^ 56] for sq in range(64)])
+        scores[1].append([-(values[piece_type] + table[sq]) for sq in range(64)])
+    return scores
+
+MG_SCORES = _square_scores(MG_VALUES, MG_TABLES)
+EG_SCORES = _square_scores(EG_VALUES, EG_TABLES)
+
+
+def taper(mg, eg, phase):
+    phase = min(phase, MAX_PHASE)
+    return (mg * phase + eg * (MAX_PHASE - phase)) // MAX_PHASE
+
+def evaluate(position):
+    # Score of a BitboardPosition for the side to move. The middlegame and endgame sums
+    # and the phase are kept up to date by the position itself, so this is O(1).
+    score = taper(position.mg, position.eg, position.phase)
+    return score if position.turn == 0 else -score
+
+def evaluate_board(position):
+    # Score of a Position (or Board) from white's side, adding mobility from its
+    # pseudo-legal move maps.
+    score = taper(position.bitboard.mg, position.bitboard.eg, position.bitboard.phase)
+    for (piece, spots) in position.pieces_move_map.items():
+        score += MOBILITY_WEIGHT * len(spots) if piece.color == 'white' else -MOBILITY_WEIGHT * len(spots)
+    return score
+
+
+def feature_matrix(positions):
+    # One row per position, one column per (color, piece type, square), with 1 where
+    # that piece stands. Rows can be scored or fitted against in one matrix product.
+    if np is None:
+        raise ImportError("feature_matrix needs numpy")
+    positions = list(positions)
+    features = np.zeros((len(positions), 768), dtype=np.int8)
+    for (row, position) in enumerate(positions):
+        for color in (0, 1):
+            for piece_type in range(6):
+                bb = position.pieces[color][piece_type]
+                while bb:
+                    bit = bb & -bb
+                    features[row, color * 384 + piece_type * 64 + bit.bit_length() - 1] = 1
+                    bb ^= bit
+    return features
+
+def weight_vectors():
+    # Middlegame, endgame and phase weights in feature_matrix column order.
+    mg = np.array([MG_SCORES[color][piece_type][sq]
+                   for color in (0, 1) for piece_type in range(6) for sq in range(64)], dtype=np.int32)
+    eg = np.array([EG_SCORES[color][piece_type][sq]
+                   for color in (0, 1) for piece_type in range(6) for sq in range(64)], dtype=np.int32)
+    phase = np.array([PHASE_WEIGHTS[piece_type]
+                      for color in (0, 1) for piece_type in range(6) for sq in range(64)], dtype=np.int32)
+    return (mg, eg, phase)
+
+def evaluate_batch(positions, side_to_move=False):
+    # Scores many BitboardPositions at once, white's side unless side_to_move is set.
+    # Returns a numpy int array with one score per position.
+    if np is None:
+        raise ImportError("evaluate_batch needs numpy")
+    positions = list(positions)
+    features = feature_matrix(positions).astype(np.int32)
+    (mg_weights, eg_weights, phase_weights) = weight_vectors()
+    mg = features @ mg_weights
+    eg = features @ eg_weights
+    phase = np.minimum(features @ phase_weights, MAX_PHASE)
+    scores = (mg * phase + eg * (MAX_PHASE - phase)) // MAX_PHASE
+    if side_to_move:
+        turns = np.array([position.turn for position in positions])
+        scores = np.where(turns == 0, scores, -scores)
+    return scores
@@ -0,0 +1,144 @@
+import mmap
+import struct
+
+from chess.bitboard import BitboardPosition, WHITE, BLACK, iter_squares
+
+# Packed positions are 32 bytes each so that a file of them can be indexed directly:
+#   occupied squares (8 bytes, little endian)
+#   one nibble per occupied square in square order, color * 6 + piece type (16 bytes)
+#   side to move in bit 0 and castling rights in bits 1-4 (1 byte)
+#   en-passant square, 255 when there is none (1 byte)
+#   halfmove clock, capped at 255 (1 byte)
+#   fullmove number (2 bytes)
+#   3 reserved zero bytes
+PACKED_FORMAT = struct.Struct('<Q16sBBBH3x')
+PACKED_SIZE = PACKED_FORMAT.size
+
+
+def parse_epd(line):
+    # An EPD line is the first four FEN fields followed by operations such as
+    # 'bm Nf3; id "test 1";'. Returns the position and a dict of operation -> operand
+    # string. hmvc and fmvn operations set the move counters.
+    fields = line.split(None, 4)
+    position = BitboardPosition.from_fen(' '.join(fields[:4]))
+    operations = {}
+    if len(fields) > 4:
+        for operation in split_operations(fields[4]):
+            parts = operation.split(None, 1)
+            operations[parts[0]] = parts[1].strip().strip('"') if len(parts) > 1 else ''
+    if 'hmvc' in operations:
+        position.halfmove_clock = int(operations['hmvc'])
+    if 'fmvn' in operations:
+        position.fullmove_number = int(operations['fmvn'])
+    return (position, operations)
+
+def split_operations(text):
+    # Splits on ';' outside of double quoted strings.
+    operations = []
+    current = ''
+    quoted = False
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        if char == ';' and not quoted:
+            if current.strip():
+                operations.append(current.strip())
+            current = ''
+        else:
+            current += char
+    if current.strip():
+        operations.append(current.strip())
+    return operations
+
+def format_epd(position, operations=None):
+    line = ' '.join(position.to_fen().split()[:4])
+    for (opcode, operand) in (operations or {}).items():
+        if operand == '':
+            line += f' {opcode};'
+        elif ' ' in operand and not operand.startswith('"'):
+            line += f' {opcode} "{operand}";'
+        else:
+            line += f' {opcode} {operand};'
+    return line
+
+
+def pack_position(position):
+    occupied = position.occupied[WHITE] | position.occupied[BLACK]
+    codes = bytearray(16)
+    for (i, sq) in enumerate(iter_squares(occupied)):
+        (color, piece_type) = position.piece_at(sq)
+        codes[i >> 1] |= (color * 6 + piece_type) << (4 * (i & 1))
+    flags = position.turn | (position.castling << 1)
+    ep_square = position.ep_square if position.ep_square is not None else 255
+    return PACKED_FORMAT.pack(occupied, bytes(codes), flags, ep_square,
+                              min(position.halfmove_clock, 255), position.fullmove_number)
+
+def unpack_position(data, offset=0):
+    (occupied, codes, flags, ep_square, halfmove_clock, fullmove_number) = PACKED_FORMAT.unpack_from(data, offset)
+    position = BitboardPosition()
+    for (i, sq) in enumerate(iter_squares(occupied)):
+        code = (codes[i >> 1] >> (4 * (i & 1))) & 15
+        position.put_piece(sq, code // 6, code % 6)
+    position.turn = flags & 1
+    position.castling = flags >> 1
+    position.ep_square = ep_square if ep_square != 255 else None
+    position.halfmove_clock = halfmove_clock
+    position.fullmove_number = fullmove_number
+    position.key = position.compute_key()
+    return position
+
+
+def write_packed(file, positions):
+    # Appends positions to an open binary file, returns how many were written.
+    count = 0
+    for position in positions:
+        file.write(pack_position(position))
+        count += 1
+    return count
+
+
+class RecordFile:
+    # Read-only, memory-mapped view of a file of fixed-size records. decode(data, offset)
+    # turns the record at offset into a value; records are decoded on access, so a large
+    # file costs no memory up front.
+    def __init__(self, path, record_size, decode):
+        self.file = open(path, 'rb')
+        size = self.file.seek(0, 2)
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.record_size = record_size
+        self.decode = decode
+        self.count = size // record_size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self.record(index)
+
+    def record(self, index):
+        return self.decode(self.data, index * self.record_size)
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self.record(index)
+
+    def close(self):
+        if self.data:
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PackedPositionFile(RecordFile):
+    # A file of packed positions, indexed like a list.
+    def __init__(self, path):
+        super().__init__(path, PACKED_SIZE, unpack_position)
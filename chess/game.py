@@ -1,103 +1,214 @@
 from chess.board import Board
+from chess.book import OpeningBook
+from chess.bitboard import COLOR_NAMES, move_to_uci
+from chess.search import Searcher, MAX_PLY
+from chess.tablebase import Tablebase
+from chess.transposition import TranspositionTable
+from chess.parallel import ParallelSearcher
 import pygame
+import queue
 import sys
+import threading
+import time
 
 class Game:
-    def __init__(self):
-        self.board = Board()
-        self.current_turn = 'white'
+    def __init__(self, board=None, white='human', black='human', engine_time_ms=1000, engine_threads=1, fps=30,
+                 ponder=False, book=None, tablebase=None):
+        self.board = board if board is not None else Board()
+        self.current_turn = COLOR_NAMES[self.board.bitboard.turn]
+        # 'human' or 'engine' for each side; the engine gets engine_time_ms per move
+        self.players = {'white': white, 'black': black}
+        self.engine_time_ms = engine_time_ms
+        self.tt = TranspositionTable()
+        # with more than one thread the engine searches in a pool of worker processes
+        self.parallel_searcher = ParallelSearcher(engine_threads) if engine_threads > 1 else None
+        self.fps = fps
+        self.clock = pygame.time.Clock()
+        self.selected_piece = None
+        # None while the game goes on, see BitboardPosition.outcome
+        self.outcome = self.board.outcome()
+
+        # The search runs on a background thread and reports through this queue, the
+        # frame loop picks the reports up. Every search gets an id so that reports of
+        # a search that was given up are ignored.
+        self.updates = queue.Queue()
+        self.searcher = None
+        self.search_thread = None
+        self.search_id = 0
+        # with ponder set the engine searches the expected reply on the human's time
+        self.ponder = ponder
+        self.pondering = False
+        self.ponder_key = None
+        self.ponder_result = None
+        # Polyglot book (an OpeningBook or the path of a .bin file) the engine plays
+        # from while the position is in it
+        self.book = OpeningBook(book) if isinstance(book, str) else book
+        # endgame tables (a Tablebase or the directory of the table files)
+        self.tablebase = Tablebase(tablebase) if isinstance(tablebase, str) else tablebase
 
     def play(self):
         pygame.init()
         running = True
-        self.board.display()
-        pygame.display.flip()
+        self.refresh()
         while running:
             # Handle events
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
+                elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                    self.handle_click(event.pos)
             if not self.is_game_over():
-                self.handle_turn()
-            self.board.display()
-            pygame.display.flip()
+                self.update_engine()
+            self.refresh()
+            self.clock.tick(self.fps)
+        self.stop_search()
+        if self.parallel_searcher is not None:
+            self.parallel_searcher.close()
+        if self.book is not None:
+            self.book.close()
+        if self.tablebase is not None:
+            self.tablebase.close()
         pygame.quit()
         sys.exit()
 
-
-
-    def choose_piece(self):
-        piece = None
-        while piece is None:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                if event.type == pygame.MOUSEBUTTONDOWN:
-                    if event.button == 1:
-                        mouse_pos = pygame.mouse.get_pos()
-                        board_coords = (mouse_pos[1] // 80, mouse_pos[0] // 80)
-                        temp_piece = self.board.get_piece(board_coords)
-                        if temp_piece is not None:
-                            if temp_piece.color == self.current_turn:
-                                print(temp_piece.get_legal_moves())
-                                if temp_piece.get_legal_moves() == []:
-                                    print('choose other piece')
-                                else:
-                                    piece = temp_piece
-                            else:
-                                print('not your piece')
-        print(f"chosen piece: {piece}")
-        return piece
-
-    def choose_move_spot(self, piece):
-        piece_moves = piece.get_legal_moves()
-        print('legal_moves: {}'.format(piece_moves))
-
-        for legal_move in piece_moves:
-            (row, col) = legal_move
-            legal_spot_image = pygame.image.load(f'chess\images\legal_move_spot.png')
-            legal_spot_image = pygame.transform.scale(legal_spot_image, (self.board.square_size, self.board.square_size))
-            self.board.window.blit(legal_spot_image, (col * self.board.square_size, row * self.board.square_size))
-        pygame.display.flip()
-
-        move = None
-        while move is None:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                if event.type == pygame.MOUSEBUTTONDOWN:
-                    if event.button == 1:
-                        mouse_pos = pygame.mouse.get_pos()
-                        board_coords = (mouse_pos[1] // 80, mouse_pos[0] // 80)
-                        if board_coords in piece_moves:
-                            move = board_coords
-                        else:
-                            print('not a legal move')
-        return move
-
-    def handle_turn(self):
-        piece = self.choose_piece()
-        move_spot = self.choose_move_spot(piece)
-
-        move = {"piece" : piece,
-                "to_spot" : move_spot
-                }
-
-        self.make_move(move)
+    def handle_click(self, mouse_pos):
+        if self.players[self.current_turn] != 'human' or self.is_game_over():
+            return
+        board_coords = (mouse_pos[1] // self.board.square_size, mouse_pos[0] // self.board.square_size)
+        if self.selected_piece is not None and board_coords in self.selected_piece.get_legal_moves():
+            move = {"piece": self.selected_piece,
+                    "to_spot": board_coords
+                    }
+            self.select_piece(None)
+            self.make_move(move)
+            self.switch_turn()
+            self.after_human_move()
+            return
+        piece = self.board.get_piece(board_coords)
+        if piece is not None and piece.color == self.current_turn and piece.get_legal_moves():
+            self.select_piece(piece)
+        else:
+            self.select_piece(None)
+
+    def select_piece(self, piece):
+        self.selected_piece = piece
+        self.board.show_legal_move_spots(piece.get_legal_moves() if piece is not None else [])
+
+    def refresh(self):
+        rects = self.board.display()
+        if rects:
+            pygame.display.update(rects)
+
+    def update_engine(self):
+        # Called once per frame: handles what the search reported since the last frame
+        # and starts a search when it is the engine's move.
+        while True:
+            try:
+                (search_id, kind, result) = self.updates.get_nowait()
+            except queue.Empty:
+                break
+            if search_id != self.search_id:
+                continue
+            if kind == 'info':
+                self.show_engine_info(result)
+            elif self.pondering:
+                # finished before the human moved, kept for a ponder hit
+                self.ponder_result = result
+            else:
+                self.search_thread.join()
+                self.search_thread = None
+                self.searcher = None
+                self.play_engine_move(result)
+
+        if (self.players[self.current_turn] == 'engine' and self.search_thread is None
+                and self.board.bitboard.legal_moves()):
+            book_move = self.book.choose(self.board.bitboard) if self.book is not None else 0
+            if book_move:
+                print(f"engine: book move {move_to_uci(book_move)}")
+                self.make_move(self.board.decode_move(book_move))
+                self.switch_turn()
+            else:
+                self.start_search()
+
+    def start_search(self, ponder_move=0):
+        position = self.board.bitboard.copy()
+        if ponder_move:
+            position.make_move(ponder_move)
+            self.ponder_key = position.key
+        self.pondering = bool(ponder_move)
+        self.ponder_result = None
+        self.search_id += 1
+        search_id = self.search_id
+        on_iteration = lambda result: self.updates.put((search_id, 'info', result))
+
+        if self.parallel_searcher is not None and not ponder_move:
+            self.searcher = None
+            run = lambda: self.parallel_searcher.search(position, time_ms=self.engine_time_ms)
+        else:
+            self.searcher = Searcher(position, self.tt, on_iteration, self.tablebase)
+            if ponder_move:
+                run = lambda searcher=self.searcher: searcher.search(MAX_PLY - 1)
+            else:
+                run = lambda searcher=self.searcher: searcher.search(time_ms=self.engine_time_ms)
+        self.search_thread = threading.Thread(target=lambda: self.updates.put((search_id, 'done', run())),
+                                              daemon=True)
+        self.search_thread.start()
+
+    def stop_search(self):
+        if self.search_thread is None:
+            return
+        if self.searcher is not None:
+            self.searcher.stop()
+        elif self.parallel_searcher is not None:
+            self.parallel_searcher.stop()
+        self.search_thread.join()
+        self.search_thread = None
+        self.searcher = None
+        self.search_id += 1
+        self.pondering = False
+        self.ponder_result = None
+
+    def after_human_move(self):
+        if not self.pondering:
+            return
+        if self.board.get_key() != self.ponder_key or self.is_game_over():
+            self.stop_search()
+            return
+        # ponder hit: the search already runs on the right position, from now on it is
+        # on the clock
+        self.pondering = False
+        if self.ponder_result is not None:
+            self.search_thread.join()
+            self.search_thread = None
+            self.searcher = None
+            self.play_engine_move(self.ponder_result)
+        elif self.searcher is not None:
+            self.searcher.deadline = time.perf_counter() + self.engine_time_ms / 1000.0
+
+    def play_engine_move(self, result):
+        if result["best_move"] is None:
+            return
+        print(f"engine: depth {result['depth']} score {result['score']} nodes {result['nodes']} nps {result['nps']}")
+        self.make_move(self.board.decode_move(result["best_move"]))
         self.switch_turn()
+        if (self.ponder and self.players[self.current_turn] == 'human' and len(result["pv"]) > 1
+                and not self.is_game_over()):
+            self.start_search(ponder_move=result["pv"][1])
+
+    def show_engine_info(self, result):
+        pv = " ".join(move_to_uci(move) for move in result["pv"][:6])
+        state = "pondering" if self.pondering else "thinking"
+        pygame.display.set_caption(f"Chess Board - {state}: depth {result['depth']} score {result['score']} {pv}")
 
     def make_move(self, move):
-        # Placeholder for making a move
         self.board.process_move(self.current_turn, move)
+        self.outcome = self.board.outcome()
+        if self.outcome is not None:
+            print(f"game over: {self.outcome['result']} ({self.outcome['reason']})")
+            pygame.display.set_caption(f"Chess Board - {self.outcome['result']} ({self.outcome['reason']})")
 
     def switch_turn(self):
         self.current_turn = 'white' if self.current_turn == 'black' else 'black'
 
     def is_game_over(self):
-        # Placeholder for game over logic
-        return False
-
-
-
+        return self.outcome is not None
@@ -0,0 +1,265 @@
+import argparse
+import cProfile
+import collections
+import functools
+import pstats
+import sys
+import threading
+import time
+
+import chess.search
+from chess.attacks import AttackMap
+from chess.bitboard import BitboardPosition, COLOR_NAMES, PIECE_LETTERS
+from chess.perft import START_FEN
+from chess.position import Position
+from chess.search import Searcher
+
+# Opt-in instrumentation. enable() swaps counting and timing wrappers in for the hot
+# methods of the move generator, the headless board and the search, and disable() puts
+# the original functions back, so nothing is paid while it is off. Timers are
+# inclusive: a phase called from another one is counted in both.
+
+_originals = {}
+_counters = collections.Counter()
+_moves_by_piece = [0] * 6
+_phase_times = collections.defaultdict(float)
+_phase_calls = collections.Counter()
+_last_search = {}
+
+
+def _timed(phase, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _phase_times[phase] += time.perf_counter() - start
+            _phase_calls[phase] += 1
+    return wrapper
+
+def _generate_moves(func):
+    @functools.wraps(func)
+    def wrapper(self):
+        moves = func(self)
+        mailbox = self.mailbox
+        for move in moves:
+            _moves_by_piece[(mailbox[move & 63] - 1) % 6] += 1
+        _counters["generate calls"] += 1
+        _counters["moves generated"] += len(moves)
+        return moves
+    return wrapper
+
+def _legal_moves(func):
+    @functools.wraps(func)
+    def wrapper(self):
+        moves = func(self)
+        _counters["legal move calls"] += 1
+        _counters["legal moves"] += len(moves)
+        return moves
+    return wrapper
+
+def _refresh_pieces(func):
+    @functools.wraps(func)
+    def wrapper(self, pieces):
+        _counters["pieces refreshed"] += len(pieces)
+        _counters["refreshes"] += 1
+        return func(self, pieces)
+    return wrapper
+
+def _search(func):
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        result = func(self, *args, **kwargs)
+        _counters["searches"] += 1
+        _counters["nodes"] += result["nodes"]
+        _last_search.clear()
+        _last_search.update({"depth": result["depth"],
+                             "nodes": result["nodes"],
+                             "iteration_nodes": result["iteration_nodes"],
+                             "tt": result["tt"]})
+        return result
+    return wrapper
+
+
+# (owner, attribute, phase timer name or None, extra wrapper or None)
+_TARGETS = [
+    (BitboardPosition, "generate_moves", "movegen", _generate_moves),
+    (BitboardPosition, "legal_moves", "legal movegen", _legal_moves),
+    (BitboardPosition, "make_move", "make", None),
+    (BitboardPosition, "unmake_move", "unmake", None),
+    (Position, "process_move", "process_move", None),
+    (AttackMap, "update", "attack map", None),
+    (Position, "get_free_spots_and_blocking", "get_free_spots_and_blocking", None),
+    (Position, "update_legal_moves", "update_legal_moves", None),
+    (Position, "_Position__refresh_pieces", "refresh pieces", _refresh_pieces),
+    (chess.search, "evaluate", "evaluate", None),
+    (Searcher, "search", "search", _search),
+]
+
+
+def enabled():
+    return bool(_originals)
+
+def enable():
+    if _originals:
+        return
+    for (owner, name, phase, extra) in _TARGETS:
+        func = getattr(owner, name)
+        _originals[(owner, name)] = func
+        wrapped = func
+        if extra is not None:
+            wrapped = extra(wrapped)
+        if phase is not None:
+            wrapped = _timed(phase, wrapped)
+        setattr(owner, name, wrapped)
+
+def disable():
+    for ((owner, name), func) in _originals.items():
+        setattr(owner, name, func)
+    _originals.clear()
+
+def reset():
+    _counters.clear()
+    _moves_by_piece[:] = [0] * 6
+    _phase_times.clear()
+    _phase_calls.clear()
+    _last_search.clear()
+
+
+def stats():
+    # Everything counted since the last reset(), as plain data.
+    refreshes = _counters["refreshes"]
+    generate_calls = _counters["generate calls"]
+    legal_calls = _counters["legal move calls"]
+    result = {"nodes": _counters["nodes"],
+              "searches": _counters["searches"],
+              "moves generated": dict(zip(("pawn", "knight", "bishop", "rook", "queen", "king"), _moves_by_piece)),
+              "pieces refreshed per move": _counters["pieces refreshed"] / refreshes if refreshes else 0.0,
+              # average pseudo-legal and legal moves per generated node
+              "pseudo-legal branching": _counters["moves generated"] / generate_calls if generate_calls else 0.0,
+              "legal branching": _counters["legal moves"] / legal_calls if legal_calls else 0.0,
+              "phases": {phase: {"calls": _phase_calls[phase], "seconds": _phase_times[phase]}
+                         for phase in sorted(_phase_times, key=_phase_times.get, reverse=True)}}
+    if _last_search:
+        tt = _last_search["tt"]
+        probes = tt["hits"] + tt["misses"]
+        result["tt hit rate"] = tt["hits"] / probes if probes else 0.0
+        result["effective branching"] = effective_branching(_last_search["iteration_nodes"])
+    return result
+
+def effective_branching(iteration_nodes):
+    # Growth of the tree from one completed iteration to the next.
+    sizes = [after - before for (before, after) in zip([0] + iteration_nodes, iteration_nodes)]
+    if len(sizes) < 2 or not sizes[-2]:
+        return 0.0
+    return sizes[-1] / sizes[-2]
+
+def info_lines():
+    # The stats as UCI 'info string' lines.
+    data = stats()
+    moves = " ".join(f"{letter}={data['moves generated'][name]}"
+                     for (letter, name) in zip(PIECE_LETTERS, data["moves generated"]))
+    lines = [f"info string stats nodes {data['nodes']} searches {data['searches']}",
+             f"info string stats moves {moves}",
+             f"info string stats branching pseudo-legal {data['pseudo-legal branching']:.2f} "
+             f"legal {data['legal branching']:.2f} effective {data.get('effective branching', 0.0):.2f}",
+             f"info string stats tt hit rate {data.get('tt hit rate', 0.0):.3f} "
+             f"pieces refreshed per move {data['pieces refreshed per move']:.2f}"]
+    for (phase, timing) in data["phases"].items():
+        lines.append(f"info string stats time {phase} {timing['seconds'] * 1000:.1f} ms {timing['calls']} calls")
+    return lines
+
+
+def profile(func, *args, pstats_path=None, folded_path=None, interval=0.001):
+    # Runs func(*args) under cProfile (dumped as pstats to pstats_path) and/or a stack
+    # sampler (written to folded_path as 'frame;frame;frame count' lines, the input
+    # format of flamegraph.pl and speedscope). Returns what func returned.
+    sampler = StackSampler(interval) if folded_path else None
+    profiler = cProfile.Profile() if pstats_path else None
+    if sampler is not None:
+        sampler.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        return func(*args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(pstats_path)
+        if sampler is not None:
+            sampler.stop()
+            sampler.write(folded_path)
+
+
+class StackSampler:
+    # Samples the Python stack of one thread (the caller's by default) from a
+    # background thread every interval seconds.
+    def __init__(self, interval=0.001, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.samples = collections.Counter()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def __run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def write(self, path):
+        with open(path, "w") as file:
+            for (stack, count) in self.samples.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search a position with instrumentation and print the stats.")
+    parser.add_argument("--fen", default=START_FEN)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--movetime", type=int, default=None)
+    parser.add_argument("--moves", type=int, default=0, help="also play this many moves through Position.process_move")
+    parser.add_argument("--pstats", help="write cProfile stats to this file")
+    parser.add_argument("--folded", help="write sampled stacks for a flame graph to this file")
+    args = parser.parse_args(argv)
+
+    def run():
+        position = Position(args.fen)
+        result = None
+        for _ in range(max(1, args.moves)):
+            result = Searcher(position.bitboard).search(args.depth, args.movetime)
+            if result["best_move"] is None or not args.moves:
+                break
+            position.process_move(COLOR_NAMES[position.bitboard.turn], result["best_move"])
+        return result
+
+    enable()
+    try:
+        profile(run, pstats_path=args.pstats, folded_path=args.folded)
+    finally:
+        disable()
+    for line in info_lines():
+        print(line)
+    if args.pstats:
+        pstats.Stats(args.pstats).sort_stats("cumulative").print_stats(15)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import argparse
+import multiprocessing
+import signal
+import sys
+import time
+from multiprocessing import shared_memory
+
+from chess.bitboard import BitboardPosition
+from chess.perft import REFERENCE_POSITIONS
+from chess.search import Searcher
+from chess.transposition import TranspositionTable, table_bytes
+
+# Lazy SMP: every worker process runs its own iterative deepening search of the same
+# position, all of them reading and writing one transposition table in shared memory.
+# Workers start at different depths so they fill the table with different parts of the
+# tree, and the others pick those results up as cutoffs and move ordering hints. The
+# main worker sets a shared stop event when it is done, which ends the helpers' searches
+# within a thousand nodes, so a parallel search takes no longer than a single one.
+
+_worker_tt = None
+_worker_stop = None
+
+
+def _init_worker(shm_name, size_mb, stop_event):
+    global _worker_tt, _worker_stop
+    # a pool forked from a pygame program inherits SDL's SIGTERM handler, which would
+    # keep terminate() from ending the workers
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    _worker_stop = stop_event
+    if _worker_tt is None:
+        # only needed when the pool does not fork, forked workers inherit the table
+        shm = shared_memory.SharedMemory(name=shm_name)
+        # attach without clearing, the other workers are already using the table
+        _worker_tt = TranspositionTable(size_mb, shm.buf, clear=False)
+        _worker_tt.shm = shm
+
+
+def _worker_search(args):
+    (position, worker_id, max_depth, time_ms) = args
+    searcher = Searcher(position, _worker_tt, stop_event=_worker_stop)
+    result = searcher.search(max_depth, time_ms, start_depth=1 + worker_id % 2)
+    if worker_id == 0:
+        _worker_stop.set()
+    return result
+
+
+class ParallelSearcher:
+    def __init__(self, threads=None, hash_mb=16):
+        global _worker_tt
+        self.threads = threads or multiprocessing.cpu_count()
+        self.hash_mb = hash_mb
+        self.shm = shared_memory.SharedMemory(create=True, size=table_bytes(hash_mb))
+        self.tt = TranspositionTable(hash_mb, self.shm.buf)
+        _worker_tt = self.tt
+        self.stop_event = multiprocessing.Event()
+        self.pool = multiprocessing.Pool(self.threads, _init_worker, (self.shm.name, hash_mb, self.stop_event))
+        _worker_tt = None
+
+    def search(self, position, max_depth=None, time_ms=None):
+        if not isinstance(position, BitboardPosition):
+            position = position.bitboard
+        position = position.copy()
+        start = time.perf_counter()
+        jobs = [(position, worker_id, max_depth, time_ms) for worker_id in range(self.threads)]
+        self.stop_event.clear()
+        results = self.pool.map(_worker_search, jobs)
+        elapsed = time.perf_counter() - start
+
+        # the main worker decides unless a helper finished a deeper iteration
+        result = results[0]
+        for other in results[1:]:
+            if other["depth"] > result["depth"] and other["best_move"] is not None:
+                result = other
+        result = dict(result)
+        result["nodes"] = sum(other["nodes"] for other in results)
+        result["time_ms"] = int(elapsed * 1000)
+        result["nps"] = int(result["nodes"] / elapsed) if elapsed > 0 else 0
+        result["threads"] = self.threads
+        return result
+
+    def stop(self):
+        # May be called from another thread, the running search returns its best move
+        # so far.
+        self.stop_event.set()
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        self.tt = None
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def parallel_search(position, max_depth=None, time_ms=None, threads=None, hash_mb=16):
+    with ParallelSearcher(threads, hash_mb) as searcher:
+        return searcher.search(position, max_depth, time_ms)
+
+
+def benchmark(depth=4, threads=2, hash_mb=16, out=sys.stdout):
+    # Fixed-depth searches of the perft reference positions, once with a single searcher
+    # and once with the worker pool, each starting from an empty table. Returns the two
+    # wall-clock times in seconds.
+    start = time.perf_counter()
+    for (name, fen, _) in REFERENCE_POSITIONS:
+        Searcher(BitboardPosition.from_fen(fen), TranspositionTable(hash_mb)).search(depth)
+    single = time.perf_counter() - start
+    with ParallelSearcher(threads, hash_mb) as searcher:
+        start = time.perf_counter()
+        for (name, fen, _) in REFERENCE_POSITIONS:
+            searcher.tt.clear()
+            searcher.search(BitboardPosition.from_fen(fen), depth)
+        parallel = time.perf_counter() - start
+    print(f"depth {depth}: 1 thread {single * 1000:.0f} ms, {threads} threads {parallel * 1000:.0f} ms, "
+          f"speedup {single / parallel:.2f}x on {multiprocessing.cpu_count()} cpus", file=out)
+    return (single, parallel)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare fixed-depth search times with and without Lazy SMP.")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--hash", type=int, default=16, help="transposition table MB")
+    args = parser.parse_args(argv)
+    benchmark(args.depth, args.threads, args.hash)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
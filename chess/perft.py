@@ -0,0 +1,150 @@
+import argparse
+import sys
+import time
+
+from chess.bitboard import BitboardPosition, WHITE_KINGSIDE, move_from, move_to, move_to_uci
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# Standard perft positions with their known leaf counts per depth (from depth 1).
+REFERENCE_POSITIONS = [
+    ("start", START_FEN,
+     [20, 400, 8902, 197281, 4865609, 119060324]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603, 193690690]),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624, 11030083]),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333, 15833292]),
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487, 89941194]),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594, 164075551]),
+]
+
+# FENs from_fen must refuse with a ValueError.
+ILLEGAL_FENS = [
+    ("extra rook", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNRR w KQkq - 0 1"),
+    ("nine files", "rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"),
+    ("bad side", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1"),
+    ("five fields", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0"),
+    ("no king", "rnbq1bnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQ - 0 1"),
+    ("seven ranks", "rnbqkbnr/pppppppp/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"),
+    ("side not to move in check", "4k3/8/8/8/8/8/8/4R1K1 w - - 0 1"),
+    ("pawn on rank 8", "P3k3/8/8/8/8/8/8/4K3 w - - 0 1"),
+]
+
+
+def perft(position, depth):
+    # Number of leaf nodes of the legal move tree below position, depth plies deep.
+    moves = position.legal_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+
+def divide(position, depth):
+    # Leaf counts split by root move, to find the move where a generator goes wrong.
+    counts = {}
+    for move in position.legal_moves():
+        position.make_move(move)
+        counts[move_to_uci(move)] = perft(position, depth - 1)
+        position.unmake_move()
+    return counts
+
+
+def timed_perft(fen, depth):
+    position = BitboardPosition.from_fen(fen)
+    start = time.perf_counter()
+    nodes = perft(position, depth)
+    elapsed = time.perf_counter() - start
+    return (nodes, elapsed)
+
+
+def run_suite(max_depth, out=sys.stdout):
+    # Checks every reference position up to max_depth, returns True when all counts match.
+    all_ok = True
+    total_nodes = 0
+    total_time = 0.0
+    for (name, fen, expected) in REFERENCE_POSITIONS:
+        depth = min(max_depth, len(expected))
+        (nodes, elapsed) = timed_perft(fen, depth)
+        ok = nodes == expected[depth - 1]
+        all_ok = all_ok and ok
+        total_nodes += nodes
+        total_time += elapsed
+        nps = int(nodes / elapsed) if elapsed > 0 else 0
+        print(f"{name:12} depth {depth}  {nodes:>10} nodes  expected {expected[depth - 1]:>10}  "
+              f"{'ok' if ok else 'FAIL'}  {elapsed:.2f}s  {nps} nps", file=out)
+    all_ok = run_regressions(out) and all_ok
+    nps = int(total_nodes / total_time) if total_time > 0 else 0
+    print(f"total {total_nodes} nodes in {total_time:.2f}s, {nps} nps, {'all ok' if all_ok else 'FAILED'}", file=out)
+    return all_ok
+
+
+def run_regressions(out=sys.stdout):
+    # Cases past bugs came from: illegal FENs, castling without the king and rook on
+    # their squares, and a search stopped inside its first iteration. Returns True when
+    # all of them pass.
+    from chess.search import Searcher
+    from chess.transposition import TranspositionTable
+
+    checks = []
+    for (name, fen) in ILLEGAL_FENS:
+        try:
+            BitboardPosition.from_fen(fen)
+            checks.append((f"illegal fen: {name}", False))
+        except ValueError:
+            checks.append((f"illegal fen: {name}", True))
+
+    # a knight stands where the rook should be, so the K right is dropped...
+    position = BitboardPosition.from_fen("4k3/8/8/8/8/8/8/4K2N w K - 0 1")
+    checks.append(("castling right without its rook dropped", position.castling == 0))
+    # ...and the generator does not castle even when the right is forced back on
+    position.castling = WHITE_KINGSIDE
+    castles = [move for move in position.legal_moves() if move_from(move) == 4 and move_to(move) == 6]
+    checks.append(("no castling with a phantom rook", not castles))
+
+    position = BitboardPosition.from_fen(REFERENCE_POSITIONS[1][1])
+    result = Searcher(position, TranspositionTable(1)).search(max_nodes=100)
+    checks.append(("partial first iteration returns a move",
+                   result["best_move"] in position.legal_moves() and result["pv"][:1] == [result["best_move"]]))
+
+    for (name, ok) in checks:
+        print(f"{name:48} {'ok' if ok else 'FAIL'}", file=out)
+    return all(ok for (name, ok) in checks)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count move generator leaf nodes (perft).")
+    parser.add_argument("--fen", default=START_FEN)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--divide", action="store_true", help="print the count below every root move")
+    parser.add_argument("--suite", action="store_true", help="check the reference positions")
+    args = parser.parse_args(argv)
+
+    if args.suite:
+        return 0 if run_suite(args.depth) else 1
+
+    position = BitboardPosition.from_fen(args.fen)
+    start = time.perf_counter()
+    if args.divide:
+        counts = divide(position, args.depth)
+        for move in sorted(counts):
+            print(f"{move}: {counts[move]}")
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(position, args.depth)
+    elapsed = time.perf_counter() - start
+    nps = int(nodes / elapsed) if elapsed > 0 else 0
+    print(f"nodes {nodes}  time {elapsed:.2f}s  nps {nps}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
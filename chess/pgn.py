@@ -0,0 +1,168 @@
+import re
+
+from chess.bitboard import (BitboardPosition, PAWN, KING, PIECE_LETTERS, SPECIAL, square_name, parse_square,
+                            move_to_uci, move_from, move_to, move_promotion)
+from chess.perft import START_FEN
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+HEADER_RE = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+MOVE_NUMBER_RE = re.compile(r'^\d+\.+|^\d+$')
+SAN_RE = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQnbrq]))?$')
+
+
+def read_games(file):
+    # Yields one game at a time from an open PGN text file, as a dict with "headers"
+    # (tag name -> value), "moves" (SAN strings of the main line) and "result". Only the
+    # current game is held in memory, so the file can be as large as it likes.
+    headers = {}
+    movetext = []
+    for line in file:
+        line = line.strip()
+        if line.startswith('%'):
+            continue
+        if line.startswith('['):
+            if movetext:
+                yield _make_game(headers, movetext)
+                headers = {}
+                movetext = []
+            match = HEADER_RE.match(line)
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+        elif line:
+            movetext.append(line)
+    if headers or movetext:
+        yield _make_game(headers, movetext)
+
+def read_files(paths):
+    # Games of several PGN files in turn, opening each file only while it is read.
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as file:
+            yield from read_games(file)
+
+def _make_game(headers, movetext):
+    (moves, result) = parse_movetext('\n'.join(movetext))
+    return {"headers": headers, "moves": moves, "result": headers.get("Result", result)}
+
+def parse_movetext(text):
+    # Main line SAN moves and the result, skipping comments, variations, NAGs and
+    # move numbers.
+    moves = []
+    result = '*'
+    depth = 0
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == '{':
+            end = text.find('}', i)
+            i = len(text) if end < 0 else end + 1
+            continue
+        if char == ';':
+            end = text.find('\n', i)
+            i = len(text) if end < 0 else end + 1
+            continue
+        if char == '(':
+            depth += 1
+            i += 1
+            continue
+        if char == ')':
+            depth = max(0, depth - 1)
+            i += 1
+            continue
+        if char.isspace():
+            i += 1
+            continue
+        start = i
+        while i < len(text) and not text[i].isspace() and text[i] not in '{}();':
+            i += 1
+        token = text[start:i]
+        if depth:
+            continue
+        if token in RESULTS:
+            result = token
+            continue
+        token = MOVE_NUMBER_RE.sub('', token)
+        if token and not token.startswith('$'):
+            moves.append(token)
+    return (moves, result)
+
+
+def starting_position(game):
+    # Position a game starts from, honouring the FEN tag of set-up games.
+    return BitboardPosition.from_fen(game["headers"].get("FEN", START_FEN))
+
+def parse_san(position, san):
+    # Legal move of the side to move matching a SAN string such as 'Nbd7', 'exd6',
+    # 'e8=Q+' or 'O-O'. Raises ValueError when there is no such move or it is ambiguous.
+    text = san.rstrip('+#!?')
+    moves = position.legal_moves()
+    if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        long = text.count('-') == 2
+        for move in moves:
+            if move & SPECIAL and position.piece_type_at(move_from(move)) == KING:
+                if (move_to(move) % 8 == 2) == long:
+                    return move
+        raise ValueError(f"illegal castling move {san}")
+
+    match = SAN_RE.match(text)
+    if not match:
+        raise ValueError(f"invalid SAN move {san}")
+    (piece, from_file, from_rank, to_name, promotion) = match.groups()
+    piece_type = PIECE_LETTERS.index(piece.lower()) if piece else PAWN
+    to_sq = parse_square(to_name)
+    promotion = PIECE_LETTERS.index(promotion.lower()) if promotion else 0
+    found = []
+    for move in moves:
+        from_sq = move_from(move)
+        if move_to(move) != to_sq or position.piece_type_at(from_sq) != piece_type:
+            continue
+        if move_promotion(move) != promotion:
+            continue
+        if from_file and 'abcdefgh'.index(from_file) != from_sq % 8:
+            continue
+        if from_rank and int(from_rank) - 1 != from_sq // 8:
+            continue
+        found.append(move)
+    if len(found) != 1:
+        raise ValueError(f"{'ambiguous' if found else 'illegal'} move {san}")
+    return found[0]
+
+def parse_uci(position, text):
+    # Legal move of the side to move in UCI notation ('e2e4', 'e7e8q', castling as the
+    # king's move). Raises ValueError when there is no such move.
+    for move in position.legal_moves():
+        if move_to_uci(move) == text:
+            return move
+    raise ValueError(f"illegal move {text}")
+
+def move_to_san(position, move):
+    # SAN of a legal move of the side to move, with a check or mate suffix.
+    from_sq = move_from(move)
+    to_sq = move_to(move)
+    piece_type = position.piece_type_at(from_sq)
+    if piece_type == KING and move & SPECIAL:
+        san = 'O-O-O' if to_sq % 8 == 2 else 'O-O'
+    else:
+        capture = position.piece_type_at(to_sq) >= 0 or (piece_type == PAWN and move & SPECIAL)
+        if piece_type == PAWN:
+            san = square_name(from_sq)[0] if capture else ''
+        else:
+            san = PIECE_LETTERS[piece_type].upper()
+            others = [other for other in position.legal_moves()
+                      if other != move and move_to(other) == to_sq
+                      and position.piece_type_at(move_from(other)) == piece_type]
+            if others:
+                if all(move_from(other) % 8 != from_sq % 8 for other in others):
+                    san += square_name(from_sq)[0]
+                elif all(move_from(other) // 8 != from_sq // 8 for other in others):
+                    san += square_name(from_sq)[1]
+                else:
+                    san += square_name(from_sq)
+        san += ('x' if capture else '') + square_name(to_sq)
+        if move_promotion(move):
+            san += '=' + PIECE_LETTERS[move_promotion(move)].upper()
+    position.make_move(move)
+    if position.in_check():
+        san += '#' if not position.legal_moves() else '+'
+    position.unmake_move()
+    return san
@@ -1,4 +1,6 @@
 class Piece:
+    __slots__ = ('color', 'position')
+
     def __init__(self, color, pos):
         self.color = color
         self.position = pos
@@ -14,6 +16,8 @@ class Piece:
 
 
 class Pawn(Piece):
+    __slots__ = ('first_move', 'legal_moves')
+
     def __init__(self, color, pos):
         super().__init__(color, pos)
         self.first_move = True
@@ -32,6 +36,8 @@ class Pawn(Piece):
         self.legal_moves = legal_moves
 
 class Rook(Piece):
+    __slots__ = ('legal_moves',)
+
     def __init__(self, color, pos):
         super().__init__(color, pos)
         self.legal_moves = []
@@ -47,6 +53,8 @@ class Rook(Piece):
         self.legal_moves = legal_moves
 
 class Knight(Piece):
+    __slots__ = ('legal_moves',)
+
     def __init__(self, color, pos):
         super().__init__(color, pos)
         self.legal_moves = []
@@ -63,6 +71,8 @@ class Knight(Piece):
         self.legal_moves = legal_moves
 
 class Bishop(Piece):
+    __slots__ = ('legal_moves',)
+
     def __init__(self, color, pos):
         super().__init__(color, pos)
         self.legal_moves = []
@@ -77,6 +87,8 @@ class Bishop(Piece):
         self.legal_moves = legal_moves
 
 class Queen(Piece):
+    __slots__ = ('legal_moves',)
+
     def __init__(self, color, pos):
         super().__init__(color, pos)
         self.legal_moves = []
@@ -91,6 +103,8 @@ class Queen(Piece):
         self.legal_moves = legal_moves
 
 class King(Piece):
+    __slots__ = ('legal_moves',)
+
     def __init__(self, color, pos):
         super().__init__(color, pos)
         self.legal_moves = []
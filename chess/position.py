@@ -0,0 +1,266 @@
+from chess.pieces import Pawn, Rook, Knight, Bishop, Queen, King
+from chess.attacks import AttackMap
+from chess.bitboard import BitboardPosition, WHITE, BLACK, PAWN, COLORS, COLOR_NAMES, PIECE_CLASSES, PIECE_TYPES, CASTLING_ROOKS, square, coords, iter_squares, move_from, move_to, move_promotion
+
+class Position:
+    def __init__(self, fen=None, debug=False):
+        if fen is None:
+            self.board = self.__create_board()
+            self.bitboard = BitboardPosition.from_board(self.board)
+        else:
+            self.bitboard = BitboardPosition.from_fen(fen)
+            self.board = self.__board_from_bitboard()
+
+        # Which piece attacks which square, updated along the rays through the changed
+        # squares only. With debug set it is checked against a full recomputation after
+        # every move.
+        self.attack_map = AttackMap(self.bitboard, debug)
+        # every piece's pseudo-legal reach and the pieces standing in it, refreshed only
+        # for the pieces the attack map reports as affected by a move
+        self.pieces_blocking_map = {}
+        self.pieces_move_map = {}
+        self.__refresh_pieces([piece for row in self.board for piece in row if piece is not None])
+        self.update_legal_moves()
+
+        self.undo_stack = []
+        # squares whose contents changed, for front ends that redraw only those
+        self.dirty_squares = set()
+    def __create_board(self):
+        board = [[None for _ in range(8)] for _ in range(8)]
+        self.__setup_pieces(board)
+        return board
+    def __setup_pieces(self, board):
+        # Initialize pawns
+        for i in range(8):
+            board[1][i] = Pawn('white', (1, i))
+            board[6][i] = Pawn('black', (6, i))
+
+        # Initialize other pieces
+        placement = [Rook, Knight, Bishop, Queen, King, Bishop, Knight, Rook]
+        for i, piece in enumerate(placement):
+            board[0][i] = piece('white', (0, i))
+            board[7][i] = piece('black', (7, i))
+    def __board_from_bitboard(self):
+        board = [[None for _ in range(8)] for _ in range(8)]
+        for sq in iter_squares(self.bitboard.all_occupied()):
+            (color, piece_type) = self.bitboard.piece_at(sq)
+            (row, col) = coords(sq)
+            piece = PIECE_CLASSES[piece_type](COLOR_NAMES[color], (row, col))
+            if isinstance(piece, Pawn) and row != (1 if color == WHITE else 6):
+                piece.first_move_done()
+            board[row][col] = piece
+        return board
+
+    def to_fen(self):
+        return self.bitboard.to_fen()
+
+    def close_out(self, piece):
+        # Pieces whose moves change when this piece leaves its square.
+        i, j = piece.position
+        sq = square(i, j)
+        return self.__pieces_on(self.__affected_by([sq]) & ~(1 << sq))
+    def get_free_spots_and_blocking(self, piece):
+        i, j = piece.position
+        sq = square(i, j)
+        color = COLORS[piece.color]
+        occupied = self.bitboard.all_occupied()
+        # pawns are only stopped by enemies they can take, pieces in front of them are
+        # not captures
+        if isinstance(piece, Pawn):
+            (free_bb, blocking_bb) = (self.bitboard.pawn_pushes(color, sq),
+                                      self.attack_map.attacks_from(sq) & self.bitboard.occupied[1 - color])
+        else:
+            reach = self.attack_map.attacks_from(sq)
+            (free_bb, blocking_bb) = (reach & ~occupied, reach & occupied)
+        free_spots = [coords(sq) for sq in iter_squares(free_bb)]
+        blocking_pieces = self.__pieces_on(blocking_bb)
+        return (free_spots, blocking_pieces)
+
+
+    def process_move(self, player, move):
+        self.make_move(player, move)
+
+    def make_move(self, player, move):
+        if isinstance(move, int):
+            move = self.decode_move(move)
+        piece = move["piece"]
+        new_spot = move["to_spot"]
+        i, j = piece.position
+        from_sq = square(i, j)
+        to_sq = square(*new_spot)
+
+        captured_spot = new_spot
+        piece_to_capture = self.board[new_spot[0]][new_spot[1]]
+        rook = None
+        promotion = 0
+        changed_squares = [from_sq, to_sq]
+        if isinstance(piece, Pawn):
+            if piece_to_capture is None and new_spot[1] != j:
+                # en passant: the captured pawn stands next to the moving one
+                captured_spot = (i, new_spot[1])
+                piece_to_capture = self.board[i][new_spot[1]]
+                changed_squares.append(square(*captured_spot))
+            if new_spot[0] in (0, 7):
+                promotion = PIECE_TYPES[move.get("promotion", Queen)]
+        elif isinstance(piece, King) and abs(new_spot[1] - j) == 2:
+            (rook_from, rook_to) = CASTLING_ROOKS[to_sq]
+            rook = self.board[i][rook_from % 8]
+            changed_squares += [rook_from, rook_to]
+
+        self.bitboard.set_turn(COLORS[player])
+        self.bitboard.make_move(self.bitboard.encode_move(from_sq, to_sq, promotion))
+
+        self.board[i][j] = None
+        if piece_to_capture is not None:
+            self.board[captured_spot[0]][captured_spot[1]] = None
+            self.__forget_piece(piece_to_capture)
+        moved_piece = piece
+        if promotion:
+            moved_piece = PIECE_CLASSES[promotion](piece.color, new_spot)
+            self.__forget_piece(piece)
+        self.board[new_spot[0]][new_spot[1]] = moved_piece
+        piece.update_position(new_spot)
+        if rook is not None:
+            self.board[i][rook.position[1]] = None
+            rook.update_position(coords(rook_to))
+            self.board[i][rook.position[1]] = rook
+
+        first_move = None
+        if isinstance(piece, Pawn):
+            first_move = piece.first_move
+            piece.first_move_done()
+
+        self.undo_stack.append((piece, (i, j), piece_to_capture, captured_spot, first_move, moved_piece, rook))
+
+        recomputed = self.attack_map.update(changed_squares)
+        self.__refresh_pieces(self.__pieces_on(recomputed | self.__affected_by(changed_squares)))
+        self.update_legal_moves()
+        self.dirty_squares.update(map(coords, changed_squares))
+
+    def unmake_move(self):
+        (piece, old_spot, captured_piece, captured_spot, first_move, moved_piece, rook) = self.undo_stack.pop()
+        i, j = old_spot
+        new_spot = moved_piece.position
+        changed_squares = [square(i, j), square(*new_spot)]
+        if captured_piece is not None:
+            changed_squares.append(square(*captured_spot))
+        if rook is not None:
+            changed_squares.append(square(*rook.position))
+            changed_squares.append(CASTLING_ROOKS[square(*new_spot)][0])
+
+        self.bitboard.unmake_move()
+
+        self.board[new_spot[0]][new_spot[1]] = None
+        if moved_piece is not piece:
+            self.__forget_piece(moved_piece)
+        if captured_piece is not None:
+            self.board[captured_spot[0]][captured_spot[1]] = captured_piece
+        self.board[i][j] = piece
+        piece.update_position(old_spot)
+        if first_move is not None:
+            piece.first_move = first_move
+        if rook is not None:
+            self.board[i][rook.position[1]] = None
+            rook.update_position(coords(CASTLING_ROOKS[square(*new_spot)][0]))
+            self.board[i][rook.position[1]] = rook
+
+        recomputed = self.attack_map.update(changed_squares)
+        self.__refresh_pieces(self.__pieces_on(recomputed | self.__affected_by(changed_squares)))
+        self.update_legal_moves()
+        self.dirty_squares.update(map(coords, changed_squares))
+
+    def __affected_by(self, changed_squares):
+        # Squares of the pieces whose moves can differ when the contents of
+        # changed_squares change: the pieces on them, everything attacking one (a
+        # slider's ray or a capture comes or goes) and pawns pushing onto one.
+        (white, black) = self.attack_map.attackers
+        changed = 0
+        affected = 0
+        for sq in changed_squares:
+            changed |= 1 << sq
+            affected |= white[sq] | black[sq]
+        affected |= changed
+        pawns = self.bitboard.pieces
+        affected |= ((changed >> 8) | (changed >> 16)) & pawns[WHITE][PAWN]
+        affected |= ((changed << 8) | (changed << 16)) & pawns[BLACK][PAWN]
+        return affected
+
+    def __pieces_on(self, bb):
+        return [self.board[row][col] for (row, col) in map(coords, iter_squares(bb & self.bitboard.all_occupied()))]
+
+    def __forget_piece(self, piece):
+        # pieces that had it in their blocking set attack its square and are refreshed
+        self.pieces_move_map.pop(piece, None)
+        self.pieces_blocking_map.pop(piece, None)
+
+    def __refresh_pieces(self, pieces):
+        for impacted_piece in pieces:
+            (row, col) = impacted_piece.position
+            if self.board[row][col] is not impacted_piece:
+                continue
+            (free_spots, blocking_pieces) = self.get_free_spots_and_blocking(impacted_piece)
+            self.pieces_blocking_map[impacted_piece] = set(blocking_pieces)
+            for blocking_piece in blocking_pieces:
+                if blocking_piece.color != impacted_piece.color:
+                    free_spots.append(blocking_piece.position)
+            self.pieces_move_map[impacted_piece] = free_spots
+
+    def decode_move(self, move):
+        # Turns a packed bitboard move (as returned by the search) into a move dict.
+        (row, col) = coords(move_from(move))
+        decoded = {"piece": self.board[row][col],
+                   "to_spot": coords(move_to(move))}
+        if move_promotion(move):
+            decoded["promotion"] = PIECE_CLASSES[move_promotion(move)]
+        return decoded
+
+    def bitboard_piece(self, piece):
+        return (COLORS[piece.color], PIECE_TYPES[type(piece)])
+
+    def get_key(self):
+        return self.bitboard.key
+
+    def get_piece(self, coords):
+        return self.board[coords[0]][coords[1]]
+
+    def update_legal_moves(self):
+        # pieces_move_map keeps every piece's pseudo-legal reach; the moves a piece may
+        # actually play (pins, checks, castling, en passant) come from the bitboard
+        # legal move generator, once per side.
+        bitboard = self.bitboard
+        legal_spots = {piece: [] for piece in self.pieces_move_map}
+        turn = bitboard.turn
+        ep_square = bitboard.ep_square
+        for color in (turn, 1 - turn):
+            bitboard.set_turn(color)
+            if color != turn:
+                bitboard.ep_square = None
+            for move in bitboard.legal_moves():
+                (row, col) = coords(move_from(move))
+                spots = legal_spots[self.board[row][col]]
+                to_spot = coords(move_to(move))
+                if to_spot not in spots:
+                    spots.append(to_spot)
+        bitboard.set_turn(turn)
+        bitboard.ep_square = ep_square
+        for (piece, spots) in legal_spots.items():
+            piece.set_legal_moves(spots)
+
+    def in_check(self, player):
+        return self.attack_map.in_check(COLORS[player])
+
+    def is_attacked(self, spot, player):
+        # True when a piece of player attacks spot
+        return self.attack_map.is_attacked(square(*spot), COLORS[player])
+
+    def outcome(self):
+        return self.bitboard.outcome()
+
+    def get_game_state(self):
+        game_state = {
+            "legal moves" : self.pieces_move_map,
+            "blocking pieces" : self.pieces_blocking_map,
+            "key" : self.bitboard.key,
+            "outcome" : self.outcome()
+        }
+        return game_state
\ No newline at end of file
@@ -0,0 +1,24 @@
+import os.path
+import pygame
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images')
+PIECE_NAMES = ('pawn', 'knight', 'bishop', 'rook', 'queen', 'king')
+
+
+class SpriteAtlas:
+    # Every sprite is loaded and scaled once, after the display mode is set, and then
+    # blitted straight from memory on each frame.
+    def __init__(self, square_size):
+        self.square_size = square_size
+        self.pieces = {}
+        for color in ('white', 'black'):
+            for name in PIECE_NAMES:
+                self.pieces[(color, name)] = self.__load(f'{color}_{name}.png')
+        self.legal_move_spot = self.__load('legal_move_spot.png')
+
+    def __load(self, file_name):
+        image = pygame.image.load(os.path.join(IMAGE_DIR, file_name)).convert_alpha()
+        return pygame.transform.scale(image, (self.square_size, self.square_size))
+
+    def piece(self, piece):
+        return self.pieces[(piece.color, piece.__class__.__name__.lower())]
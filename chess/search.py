@@ -0,0 +1,313 @@
+import time
+
+from chess.bitboard import BitboardPosition, KING, popcount
+from chess.evaluation import evaluate
+from chess.transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+# Move ordering values (MVV-LVA); the evaluation has its own tables.
+PIECE_VALUES = (100, 320, 330, 500, 900, 0)
+MATE_SCORE = 100000
+INFINITY = 1000000
+MAX_PLY = 64
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class Searcher:
+    # on_iteration, when set, is called with the result after every completed depth.
+    # stop() may be called from another thread; the search then returns its best move
+    # so far within a few thousand nodes; stop_event (e.g. a multiprocessing.Event shared
+    # with other processes) stops it the same way once it is set. With a tablebase,
+    # positions with few enough pieces are scored from it instead of being searched.
+    def __init__(self, position, tt=None, on_iteration=None, tablebase=None, stop_event=None):
+        if not isinstance(position, BitboardPosition):
+            position = position.bitboard
+        self.position = position.copy()
+        self.tt = tt if tt is not None else TranspositionTable()
+        self.nodes = 0
+        self.deadline = None
+        self.max_nodes = None
+        self.stopped = False
+        self.stop_event = stop_event
+        self.on_iteration = on_iteration
+        self.tablebase = tablebase
+        self.tb_hits = 0
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = [[[0] * 64 for _ in range(64)] for _ in range(2)]
+        self.pv = [[] for _ in range(MAX_PLY + 1)]
+        self.pv_line = []
+        # score of pv[0] in the iteration under way
+        self.root_score = 0
+
+    def search(self, max_depth=None, time_ms=None, start_depth=1, max_nodes=None):
+        # Stops after max_depth, time_ms or (roughly, checked every 1024 nodes)
+        # max_nodes, whichever comes first.
+        start = time.perf_counter()
+        self.deadline = start + time_ms / 1000.0 if time_ms is not None else None
+        self.max_nodes = max_nodes
+        if max_depth is None:
+            max_depth = MAX_PLY - 1 if time_ms is not None or max_nodes is not None else 4
+        self.nodes = 0
+        self.tb_hits = 0
+        self.pv_line = []
+        root_depth = len(self.position.undo_stack)
+        if self.tablebase is not None:
+            result = self.tablebase_root(start)
+            if result is not None:
+                return result
+
+        result = {"best_move": None, "score": 0, "depth": 0, "pv": [], "nodes": 0, "nps": 0, "time_ms": 0,
+                  "iteration_nodes": []}
+        for depth in range(min(start_depth, max_depth), max_depth + 1):
+            try:
+                score = self.negamax(depth, -INFINITY, INFINITY, 0)
+            except SearchTimeout:
+                while len(self.position.undo_stack) > root_depth:
+                    self.position.unmake_move()
+                # the root was searched in pv order, so a partial iteration that already
+                # improved on the previous one is still usable, and a partial first
+                # iteration beats no move at all (tick lets at least one root move finish);
+                # the score then is the one that move got in this iteration
+                if self.pv[0] and (result["best_move"] is None or self.pv[0][0] != result["best_move"]):
+                    result["score"] = self.root_score
+                    result["pv"] = self.extend_pv(self.pv[0][:], depth - 1)
+                    result["best_move"] = self.pv[0][0]
+                break
+            elapsed = time.perf_counter() - start
+            result["best_move"] = self.pv[0][0] if self.pv[0] else None
+            result["score"] = score
+            result["depth"] = depth
+            result["pv"] = self.extend_pv(self.pv[0][:], depth)
+            result["iteration_nodes"].append(self.nodes)
+            self.pv_line = result["pv"]
+            if self.on_iteration is not None:
+                result["nodes"] = self.nodes
+                result["time_ms"] = int(elapsed * 1000)
+                result["nps"] = int(self.nodes / elapsed) if elapsed > 0 else 0
+                self.on_iteration(dict(result))
+            if abs(score) >= MATE_SCORE - MAX_PLY:
+                break
+            # the next iteration takes several times longer than this one, do not start it
+            # when it cannot finish inside the budget
+            if self.deadline is not None and start + 2 * elapsed > self.deadline:
+                break
+
+        elapsed = time.perf_counter() - start
+        result["nodes"] = self.nodes
+        result["time_ms"] = int(elapsed * 1000)
+        result["nps"] = int(self.nodes / elapsed) if elapsed > 0 else 0
+        result["tt"] = self.tt.stats()
+        result["tb_hits"] = self.tb_hits
+        return result
+
+    def extend_pv(self, pv, length):
+        # A transposition table cutoff below the root ends the collected line early, so
+        # it is continued with the table's moves up to length moves, as long as they are
+        # legal and do not repeat a position.
+        position = self.position
+        made = 0
+        seen = set()
+        for move in pv:
+            position.make_move(move)
+            made += 1
+        while len(pv) < length and position.key not in seen:
+            seen.add(position.key)
+            move = self.tt.get_move(position.key)
+            if not move or move not in position.legal_moves():
+                break
+            pv.append(move)
+            position.make_move(move)
+            made += 1
+        for _ in range(made):
+            position.unmake_move()
+        return pv
+
+    def tablebase_root(self, start):
+        # The tablebase move when the root position is in it: the fastest win, the
+        # slowest loss, or a move that keeps the draw.
+        best = self.tablebase.best_move(self.position)
+        if best is None:
+            return None
+        (move, wdl, dtz) = best
+        self.tb_hits = 1
+        elapsed = time.perf_counter() - start
+        result = {"best_move": move, "score": self.tablebase.score(self.position, 0), "depth": 1, "pv": [move],
+                  "nodes": 1, "nps": 0, "time_ms": int(elapsed * 1000), "iteration_nodes": [1],
+                  "tt": self.tt.stats(), "tb_hits": 1, "dtz": dtz}
+        if self.on_iteration is not None:
+            self.on_iteration(dict(result))
+        return result
+
+    def negamax(self, depth, alpha, beta, ply):
+        self.pv[ply] = []
+        if depth <= 0 or ply >= MAX_PLY:
+            return self.quiescence(alpha, beta, ply)
+        self.tick()
+
+        position = self.position
+        if ply > 0 and position.is_draw():
+            return 0
+        tablebase = self.tablebase
+        if (tablebase is not None and ply > 0 and not position.castling
+                and popcount(position.occupied[0] | position.occupied[1]) <= tablebase.probe_limit):
+            score = tablebase.score(position, ply)
+            if score is not None:
+                self.tb_hits += 1
+                return score
+        key = position.key
+        tt_move = 0
+        entry = self.tt.probe(key)
+        if entry is not None:
+            (tt_move, tt_score, tt_depth, bound) = entry
+            if ply > 0 and tt_depth >= depth:
+                tt_score = score_from_tt(tt_score, ply)
+                if (bound == EXACT
+                        or (bound == LOWER and tt_score >= beta)
+                        or (bound == UPPER and tt_score <= alpha)):
+                    return tt_score
+
+        color = position.turn
+        in_check = position.in_check(color)
+        if in_check:
+            depth += 1
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = 0
+        legal = 0
+        for move in self.ordered_moves(position.generate_moves(), ply, tt_move):
+            position.make_move(move)
+            if position.in_check(color):
+                position.unmake_move()
+                continue
+            legal += 1
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            position.unmake_move()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+                self.pv[ply] = [move] + self.pv[ply + 1]
+                if ply == 0:
+                    self.root_score = score
+                if score >= beta:
+                    if not self.is_capture(move):
+                        self.store_killer(move, ply)
+                        self.history[color][move & 63][(move >> 6) & 63] += depth * depth
+                    break
+
+        if legal == 0:
+            return -MATE_SCORE + ply if in_check else 0
+
+        if best_score >= beta:
+            bound = LOWER
+        elif best_score > original_alpha:
+            bound = EXACT
+        else:
+            bound = UPPER
+        self.tt.store(key, depth, bound, score_to_tt(best_score, ply), best_move)
+        return best_score
+
+    def quiescence(self, alpha, beta, ply):
+        self.tick()
+        position = self.position
+        stand_pat = evaluate(position)
+        if stand_pat >= beta or ply >= MAX_PLY:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        color = position.turn
+        enemies = position.occupied[1 - color]
+        captures = [move for move in position.generate_moves() if (1 << ((move >> 6) & 63)) & enemies or (move >> 12) & 7]
+        for move in self.ordered_moves(captures, ply):
+            position.make_move(move)
+            if position.in_check(color):
+                position.unmake_move()
+                continue
+            score = -self.quiescence(-beta, -alpha, ply + 1)
+            position.unmake_move()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def tick(self):
+        # Limits are only enforced once the root has a scored move (pv[0] is filled by
+        # the first legal root move of an iteration and kept from then on); before that
+        # the previous iteration's move, or nothing at all, is all there is.
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and (self.pv[0] or self.pv_line):
+            if (self.stopped or (self.stop_event is not None and self.stop_event.is_set())
+                    or (self.deadline is not None and time.perf_counter() > self.deadline)
+                    or (self.max_nodes is not None and self.nodes >= self.max_nodes)):
+                raise SearchTimeout()
+
+    def stop(self):
+        self.stopped = True
+
+    def is_capture(self, move):
+        return (1 << ((move >> 6) & 63)) & self.position.occupied[1 - self.position.turn] != 0
+
+    def store_killer(self, move, ply):
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+
+    def ordered_moves(self, moves, ply, tt_move=0):
+        position = self.position
+        color = position.turn
+        enemies = position.occupied[1 - color]
+        pv_move = self.pv_line[ply] if ply < len(self.pv_line) else 0
+        killers = self.killers[ply] if ply < MAX_PLY else (0, 0)
+        history = self.history[color]
+        scores = {}
+        for move in moves:
+            from_sq = move & 63
+            to_sq = (move >> 6) & 63
+            if move == tt_move:
+                score = 1 << 31
+            elif move == pv_move:
+                score = 1 << 30
+            elif (1 << to_sq) & enemies:
+                # MVV-LVA: most valuable victim first, then least valuable attacker
+                victim = position.piece_type_at(to_sq)
+                attacker = position.piece_type_at(from_sq)
+                score = (1 << 20) + PIECE_VALUES[victim] * 10 - (PIECE_VALUES[attacker] if attacker != KING else 1000)
+            elif (move >> 12) & 7:
+                score = (1 << 20) + PIECE_VALUES[(move >> 12) & 7]
+            elif move == killers[0]:
+                score = (1 << 19) + 1
+            elif move == killers[1]:
+                score = 1 << 19
+            else:
+                score = history[from_sq][to_sq]
+            scores[move] = score
+        return sorted(moves, key=scores.__getitem__, reverse=True)
+
+
+def score_to_tt(score, ply):
+    # Mate scores are stored relative to the node, not the root, so they stay valid
+    # when the position is reached through a different path.
+    if score >= MATE_SCORE - MAX_PLY:
+        return score + ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score - ply
+    return score
+
+def score_from_tt(score, ply):
+    if score >= MATE_SCORE - MAX_PLY:
+        return score - ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score + ply
+    return score
+
+
+def search(position, max_depth=None, time_ms=None, tt=None):
+    return Searcher(position, tt).search(max_depth, time_ms)
@@ -0,0 +1,174 @@
+import argparse
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import time
+
+from chess.bitboard import BitboardPosition
+from chess.book import OpeningBook
+from chess.fen import RecordFile, pack_position, unpack_position
+from chess.perft import START_FEN
+from chess.search import Searcher
+from chess.transposition import TranspositionTable
+
+# Headless engine-vs-engine games for tuning data. Every searched position is stored as
+# a fixed-size record, so a dataset is a plain array that can be memory-mapped:
+#   packed position (32 bytes, see chess/fen.py)
+#   search score for the side to move, clamped to 16 bits (2 bytes)
+#   game result for white: 1, 0 or -1 (1 byte), 1 reserved byte
+#   ply of the game (2 bytes)
+#   best move found, packed (2 bytes)
+RECORD_FORMAT = struct.Struct('<32shbxHH')
+RECORD_SIZE = RECORD_FORMAT.size
+
+RESULT_VALUES = {'1-0': 1, '0-1': -1, '1/2-1/2': 0}
+
+_worker = {}
+
+
+def _init_worker(settings):
+    _worker.update(settings)
+    _worker["tt"] = TranspositionTable(settings["hash_mb"])
+    _worker["book"] = OpeningBook(settings["book"]) if settings["book"] else None
+
+
+def opening(rng, book=None, random_plies=8):
+    # Start position of a game: book moves while there are any, then random_plies
+    # random legal moves. None when the game ended during the opening.
+    position = BitboardPosition.from_fen(START_FEN)
+    if book is not None:
+        book.random = rng
+        while True:
+            move = book.choose(position)
+            if not move:
+                break
+            position.make_move(move)
+    for _ in range(random_plies):
+        moves = position.legal_moves()
+        if not moves:
+            return None
+        position.make_move(rng.choice(moves))
+    return position if position.outcome() is None else None
+
+
+def play_game(seed, settings, tt=None, book=None):
+    # Plays one game from a seeded opening, returns (records as bytes, result string,
+    # number of plies).
+    rng = random.Random(seed)
+    position = None
+    while position is None:
+        position = opening(rng, book, settings["random_plies"])
+    tt = tt if tt is not None else TranspositionTable(settings["hash_mb"])
+    tt.clear()
+    records = []
+    outcome = None
+    while outcome is None:
+        if len(position.undo_stack) >= settings["max_plies"]:
+            outcome = {"result": "1/2-1/2", "reason": "move limit"}
+            break
+        result = Searcher(position, tt).search(settings["depth"], max_nodes=settings["nodes"])
+        move = result["best_move"] or position.legal_moves()[0]
+        score = max(-32768, min(32767, result["score"]))
+        records.append((pack_position(position), score, len(position.undo_stack), move))
+        position.make_move(move)
+        outcome = position.outcome()
+
+    value = RESULT_VALUES[outcome["result"]]
+    data = b''.join(RECORD_FORMAT.pack(packed, score, value, ply, move) for (packed, score, ply, move) in records)
+    return (data, outcome["result"], len(records))
+
+
+def _worker_game(seed):
+    return play_game(seed, _worker, _worker["tt"], _worker["book"])
+
+
+def shard_path(directory, shard):
+    return os.path.join(directory, f"shard-{shard:05d}.bin")
+
+def completed_shards(directory):
+    # Shards are renamed into place only when complete, so a run that was stopped
+    # restarts at the first missing one.
+    shard = 0
+    while os.path.exists(shard_path(directory, shard)):
+        shard += 1
+    return shard
+
+
+def run(directory, shards, games_per_shard, settings, workers=None, seed=0, out=sys.stdout):
+    os.makedirs(directory, exist_ok=True)
+    first = completed_shards(directory)
+    if first >= shards:
+        print(f"all {shards} shards are already complete", file=out)
+        return
+    start = time.perf_counter()
+    total_games = total_positions = 0
+    with multiprocessing.Pool(workers, _init_worker, (settings,)) as pool:
+        for shard in range(first, shards):
+            # seeds depend on the shard only, so a resumed run plays the same games
+            seeds = [seed * 1000003 + shard * games_per_shard + game for game in range(games_per_shard)]
+            path = shard_path(directory, shard)
+            results = {'1-0': 0, '0-1': 0, '1/2-1/2': 0}
+            positions = 0
+            with open(path + '.tmp', 'wb') as file:
+                for (data, result, count) in pool.imap_unordered(_worker_game, seeds):
+                    file.write(data)
+                    results[result] += 1
+                    positions += count
+            os.replace(path + '.tmp', path)
+            total_games += games_per_shard
+            total_positions += positions
+            elapsed = time.perf_counter() - start
+            print(f"shard {shard}: {games_per_shard} games (+{results['1-0']} ={results['1/2-1/2']} "
+                  f"-{results['0-1']}), {positions} positions | "
+                  f"{3600 * total_games / elapsed:.0f} games/hour, {total_positions / elapsed:.0f} positions/s",
+                  file=out, flush=True)
+
+
+def decode_record(data, offset=0):
+    # {"position", "score", "result", "ply", "move"}; score is for the side to move,
+    # result for white.
+    (_, score, result, ply, move) = RECORD_FORMAT.unpack_from(data, offset)
+    return {"position": unpack_position(data, offset),
+            "score": score,
+            "result": result,
+            "ply": ply,
+            "move": move}
+
+
+class TrainingFile(RecordFile):
+    # Read-only, memory-mapped view of a shard of self-play records.
+    def __init__(self, path):
+        super().__init__(path, RECORD_SIZE, decode_record)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play engine games and write training positions.")
+    parser.add_argument("--dir", default="selfplay")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--games", type=int, default=100, help="games per shard")
+    parser.add_argument("--depth", type=int, default=None)
+    parser.add_argument("--nodes", type=int, default=None, help="node limit per move")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--hash", type=int, default=4, help="transposition table MB per worker")
+    parser.add_argument("--book", default=None, help="Polyglot book for the openings")
+    parser.add_argument("--random-plies", type=int, default=8, help="random moves after the book")
+    parser.add_argument("--max-plies", type=int, default=400, help="adjudicate a draw after this many plies")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.depth is None and args.nodes is None:
+        args.depth = 3
+
+    settings = {"depth": args.depth,
+                "nodes": args.nodes,
+                "hash_mb": args.hash,
+                "book": args.book,
+                "random_plies": args.random_plies,
+                "max_plies": args.max_plies}
+    run(args.dir, args.shards, args.games, settings, args.workers, args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,408 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from chess.bitboard import COLOR_NAMES, move_to_uci
+from chess.pgn import parse_uci
+from chess.position import Position
+from chess.search import Searcher
+from chess.transposition import TranspositionTable
+from chess.uci import time_budget
+
+# Many games at once from one process. Clients talk newline-delimited JSON over a local
+# TCP socket, one request object per line, and every request gets one response line with
+# the same "id". Requests of one connection are handled concurrently, so responses can
+# come back out of order.
+#   {"op": "new", "white": "human", "black": "engine", "fen": ..., "time_ms": 100}
+#       or "clock_ms" and "increment_ms" for a clock per engine side, or "depth"
+#   {"op": "move", "game": 3, "move": "e2e4"}  a human move, then the engine's reply
+#   {"op": "go", "game": 3}                    the engine moves for the side to move
+#   {"op": "state", "game": 3}
+#   {"op": "close", "game": 3}
+#   {"op": "stats"}
+# Game responses hold the position (fen, turn, legal moves in UCI, ply, outcome) and,
+# when the engine moved, its move under "engine". Failures are {"error": message}.
+# Every game is a headless Position, moves go through Position.process_move, and the
+# engine searches in one pool of worker processes shared by all games.
+
+DEFAULT_PORT = 8765
+DEFAULT_TIME_MS = 100
+
+_worker_tt = None
+
+
+def _init_worker(hash_mb):
+    global _worker_tt
+    _worker_tt = TranspositionTable(hash_mb)
+
+
+def _worker_search(args):
+    (position, max_depth, time_ms) = args
+    result = Searcher(position, _worker_tt).search(max_depth, time_ms)
+    return {"best_move": result["best_move"],
+            "score": result["score"],
+            "depth": result["depth"],
+            "nodes": result["nodes"],
+            "time_ms": result["time_ms"]}
+
+
+def count_field(request, name):
+    # A non-negative integer field of a request, None when it is missing.
+    value = request.get(name)
+    if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+        raise ValueError(f"{name} must be a non-negative integer")
+    return value
+
+
+class ServerGame:
+    def __init__(self, game_id, position, players, time_ms=None, depth=None, clock_ms=None, increment_ms=0):
+        self.id = game_id
+        self.position = position
+        # 'human' or 'engine' for each side
+        self.players = players
+        self.time_ms = time_ms
+        self.depth = depth
+        # remaining milliseconds of each side's clock, None when the engine gets a fixed
+        # time_ms (or depth) per move
+        self.clocks = [clock_ms, clock_ms] if clock_ms is not None else None
+        self.increment_ms = increment_ms
+        # one request at a time changes the game
+        self.lock = asyncio.Lock()
+
+    def turn(self):
+        return COLOR_NAMES[self.position.bitboard.turn]
+
+    def budget(self):
+        # Milliseconds for the engine's next move.
+        if self.clocks is None:
+            return self.time_ms
+        return time_budget(max(0, self.clocks[self.position.bitboard.turn]), self.increment_ms)
+
+    def state(self):
+        bitboard = self.position.bitboard
+        return {"game": self.id,
+                "fen": self.position.to_fen(),
+                "turn": self.turn(),
+                "legal": [move_to_uci(move) for move in bitboard.legal_moves()],
+                "ply": len(self.position.undo_stack),
+                "outcome": self.position.outcome()}
+
+
+class GameServer:
+    def __init__(self, workers=None, hash_mb=16, max_games=10000):
+        self.games = {}
+        self.ids = itertools.count(1)
+        self.max_games = max_games
+        self.pool = ProcessPoolExecutor(workers or os.cpu_count(), initializer=_init_worker, initargs=(hash_mb,))
+        self.started = time.perf_counter()
+        self.moves_played = 0
+        self.searches = 0
+        self.ops = {"new": self.new_game,
+                    "move": self.move,
+                    "go": self.go,
+                    "state": self.state,
+                    "close": self.close_game,
+                    "stats": self.stats}
+
+    async def serve(self, host='127.0.0.1', port=DEFAULT_PORT):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"serving games on {host}:{port}", file=sys.stderr, flush=True)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    async def handle(self, reader, writer):
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(self.respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except ConnectionError:
+            pass
+        finally:
+            if tasks:
+                await asyncio.wait(tasks)
+            writer.close()
+
+    async def respond(self, line, writer):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a request is a JSON object")
+        except ValueError as error:
+            (request, response) = ({}, {"error": f"bad request: {error}"})
+        else:
+            try:
+                response = await self.dispatch(request)
+            except Exception as error:
+                # every request gets its response line, whatever went wrong
+                response = {"error": f"internal error: {type(error).__name__}: {error}"}
+        response["id"] = request.get("id")
+        if writer.is_closing():
+            return
+        writer.write(json.dumps(response).encode() + b'\n')
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def dispatch(self, request):
+        op = request.get("op")
+        handler = self.ops.get(op) if isinstance(op, str) else None
+        if handler is None:
+            return {"error": f"unknown op {request.get('op')!r}"}
+        try:
+            return await handler(request)
+        except ValueError as error:
+            return {"error": str(error)}
+
+    def game(self, request):
+        game_id = request.get("game")
+        game = self.games.get(game_id) if isinstance(game_id, int) else None
+        if game is None:
+            raise ValueError(f"no game {request.get('game')!r}")
+        return game
+
+    def apply(self, game, move):
+        game.position.process_move(game.turn(), move)
+        self.moves_played += 1
+
+    async def engine_move(self, game):
+        bitboard = game.position.bitboard
+        color = bitboard.turn
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self.pool, _worker_search, (bitboard.copy(), game.depth, game.budget()))
+        self.searches += 1
+        if game.clocks is not None:
+            game.clocks[color] += game.increment_ms - result["time_ms"]
+        move = result["best_move"] or bitboard.legal_moves()[0]
+        engine = {"move": move_to_uci(move),
+                  "score": result["score"],
+                  "depth": result["depth"],
+                  "nodes": result["nodes"],
+                  "time_ms": result["time_ms"]}
+        self.apply(game, move)
+        return engine
+
+    async def reply(self, game):
+        # The engine answers at once when it has the move against a human, engine
+        # against engine games move on 'go'.
+        state = game.state()
+        opponent = 'black' if state["turn"] == 'white' else 'white'
+        if (state["outcome"] is None and game.players[state["turn"]] == 'engine'
+                and game.players[opponent] == 'human'):
+            engine = await self.engine_move(game)
+            state = game.state()
+            state["engine"] = engine
+        return state
+
+    async def new_game(self, request):
+        if len(self.games) >= self.max_games:
+            raise ValueError(f"the server holds {self.max_games} games already")
+        players = {color: request.get(color, 'human') for color in COLOR_NAMES}
+        for player in players.values():
+            if player not in ('human', 'engine'):
+                raise ValueError(f"unknown player {player!r}")
+        (time_ms, depth, clock_ms, increment_ms) = (count_field(request, "time_ms"), count_field(request, "depth"),
+                                                    count_field(request, "clock_ms"),
+                                                    count_field(request, "increment_ms") or 0)
+        if time_ms is None and depth is None and clock_ms is None:
+            time_ms = DEFAULT_TIME_MS
+        fen = request.get("fen")
+        if fen is not None and not isinstance(fen, str):
+            raise ValueError("fen must be a string")
+        position = Position(fen)
+        game = ServerGame(next(self.ids), position, players, time_ms, depth, clock_ms, increment_ms)
+        self.games[game.id] = game
+        async with game.lock:
+            return await self.reply(game)
+
+    async def move(self, request):
+        game = self.game(request)
+        async with game.lock:
+            if game.position.outcome() is not None:
+                raise ValueError("the game is over")
+            if game.players[game.turn()] != 'human':
+                raise ValueError(f"{game.turn()} is played by the engine")
+            move = request.get("move")
+            if not isinstance(move, str):
+                raise ValueError("move must be a string in UCI notation")
+            self.apply(game, parse_uci(game.position.bitboard, move))
+            return await self.reply(game)
+
+    async def go(self, request):
+        game = self.game(request)
+        async with game.lock:
+            if game.position.outcome() is not None:
+                raise ValueError("the game is over")
+            engine = await self.engine_move(game)
+            state = game.state()
+            state["engine"] = engine
+            return state
+
+    async def state(self, request):
+        game = self.game(request)
+        async with game.lock:
+            return game.state()
+
+    async def close_game(self, request):
+        game = self.game(request)
+        del self.games[game.id]
+        return {"game": game.id, "closed": True}
+
+    async def stats(self, request):
+        elapsed = time.perf_counter() - self.started
+        return {"games": len(self.games),
+                "moves": self.moves_played,
+                "searches": self.searches,
+                "uptime_s": round(elapsed, 1),
+                "moves_per_s": round(self.moves_played / elapsed, 1) if elapsed > 0 else 0.0}
+
+
+class Client:
+    # One connection to a GameServer. Requests may be sent from many tasks at once, the
+    # responses are matched to them by id.
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.listener = asyncio.create_task(self.__listen())
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=DEFAULT_PORT):
+        (reader, writer) = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def request(self, op, **fields):
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.writer.write(json.dumps({"id": request_id, "op": op, **fields}).encode() + b'\n')
+        await self.writer.drain()
+        return await future
+
+    async def __listen(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self.pending.pop(response.get("id"), None)
+                if future is not None:
+                    future.set_result(response)
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("connection closed"))
+            self.pending.clear()
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        await self.listener
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[int(fraction * (len(values) - 1))] if values else 0.0
+
+async def load_test(host='127.0.0.1', port=DEFAULT_PORT, games=100, connections=4, engine_ms=None, plies=40,
+                    seed=0, out=sys.stdout):
+    # Plays games random moves against the server (against its engine with engine_ms
+    # per move, human against human without), spread over a number of connections.
+    # Reports moves per second, engine replies included, and the latency of the move
+    # requests. Returns the report as a dict.
+    clients = [await Client.connect(host, port) for _ in range(connections)]
+    latencies = []
+    counts = {"moves": 0, "games": 0, "errors": 0}
+
+    async def play(client, rng):
+        options = {"black": "engine", "time_ms": engine_ms} if engine_ms is not None else {}
+        state = await client.request("new", white="human", **options)
+        if "error" in state:
+            counts["errors"] += 1
+            return
+        game = state["game"]
+        while state["outcome"] is None and state["ply"] < plies:
+            start = time.perf_counter()
+            state = await client.request("move", game=game, move=rng.choice(state["legal"]))
+            latencies.append(time.perf_counter() - start)
+            if "error" in state:
+                counts["errors"] += 1
+                break
+            counts["moves"] += 2 if "engine" in state else 1
+        await client.request("close", game=game)
+        counts["games"] += 1
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(play(clients[index % connections], random.Random(seed * 1000003 + index))
+                               for index in range(games)))
+    finally:
+        for client in clients:
+            await client.close()
+    elapsed = time.perf_counter() - start
+    report = {"games": counts["games"],
+              "moves": counts["moves"],
+              "errors": counts["errors"],
+              "seconds": elapsed,
+              "moves_per_s": counts["moves"] / elapsed if elapsed > 0 else 0.0,
+              "p50_ms": 1000 * percentile(latencies, 0.5),
+              "p99_ms": 1000 * percentile(latencies, 0.99),
+              "max_ms": 1000 * max(latencies, default=0.0)}
+    print(f"{report['games']} games, {report['moves']} moves in {elapsed:.1f}s: {report['moves_per_s']:.0f} moves/s, "
+          f"move latency p50 {report['p50_ms']:.1f} ms p99 {report['p99_ms']:.1f} ms "
+          f"max {report['max_ms']:.1f} ms, {report['errors']} errors", file=out)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host many games over a local socket, or load-test such a server.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="run the game server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--workers", type=int, default=None, help="engine worker processes")
+    serve.add_argument("--hash", type=int, default=16, help="transposition table MB per worker")
+    serve.add_argument("--max-games", type=int, default=10000)
+    test = commands.add_parser("loadtest", help="play random games against a running server")
+    test.add_argument("--host", default="127.0.0.1")
+    test.add_argument("--port", type=int, default=DEFAULT_PORT)
+    test.add_argument("--games", type=int, default=100)
+    test.add_argument("--connections", type=int, default=4)
+    test.add_argument("--engine-ms", type=int, default=None, help="play against the engine with this time per move")
+    test.add_argument("--plies", type=int, default=40, help="moves per game")
+    test.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        server = GameServer(args.workers, args.hash, args.max_games)
+        try:
+            asyncio.run(server.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+    else:
+        report = asyncio.run(load_test(args.host, args.port, args.games, args.connections, args.engine_ms,
+                                       args.plies, args.seed))
+        return 1 if report["errors"] else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,486 @@
+import argparse
+import collections
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+
+from chess.bitboard import (BitboardPosition, WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, SPECIAL,
+                            iter_squares, popcount, move_from, move_to, move_to_uci)
+
+# Endgame tables in the spirit of Syzygy: for every material combination a WDL file
+# (win/draw/loss for the side to move) and a DTZ file (plies to the next capture or
+# pawn move that keeps the result, or to mate), both split into zlib-compressed blocks
+# that are decompressed on demand. The files are written by generate() below, which
+# solves small endings by retrograde analysis.
+#
+# This is the engine's own format, not Syzygy's: standard .rtbw/.rtbz Syzygy files are
+# out of scope (they need Syzygy's own indexing and compression) and are not read.
+# Tables for this reader are built with 'python -m chess.tablebase generate'.
+#
+# A table is named after its material with the stronger side first, e.g. KQvK or KRvKP,
+# and holds positions where white has the first half. Other positions are looked up
+# with the colors swapped and the board flipped. Positions are indexed as
+#   (side to move, lead square, square of every other piece)
+# where the lead piece (white king without pawns, else the first pawn) is moved into
+# a fixed part of the board by a symmetry of the board: the a1-d1-d4 triangle without
+# pawns, files a-d with pawns. Castling rights are never in a table.
+
+WDL_SUFFIX = '.tbw'
+DTZ_SUFFIX = '.tbz'
+# suffixes of Syzygy files, only recognised to say that they are not supported
+SYZYGY_SUFFIXES = ('.rtbw', '.rtbz')
+HEADER = struct.Struct('<4sBxxxIII')
+WDL_MAGIC = b'TBW1'
+DTZ_MAGIC = b'TBZ1'
+BLOCK_SIZE = 4096
+
+LOSS, BLESSED_LOSS, DRAW, CURSED_WIN, WIN = -2, -1, 0, 1, 2
+# stored byte for a square combination that is not a legal position
+INVALID = 255
+
+# letters in table names, most valuable first; kings come first on both sides
+TABLE_LETTERS = 'KQRBNP'
+LETTER_TYPES = {'K': KING, 'Q': QUEEN, 'R': ROOK, 'B': BISHOP, 'N': KNIGHT, 'P': PAWN}
+
+# Scores the search gives to tablebase wins, below mate scores so that a real mate
+# is still preferred.
+TB_WIN_SCORE = 90000
+
+
+def _transform(flip_rows, flip_cols, transpose):
+    def transform(sq):
+        (row, col) = (sq >> 3, sq & 7)
+        if transpose:
+            (row, col) = (col, row)
+        if flip_rows:
+            row = 7 - row
+        if flip_cols:
+            col = 7 - col
+        return row * 8 + col
+    return [transform(sq) for sq in range(64)]
+
+# Board symmetries as square maps, identity first.
+PAWNLESS_TRANSFORMS = [_transform(flip_rows, flip_cols, transpose)
+                       for transpose in (False, True) for flip_rows in (False, True) for flip_cols in (False, True)]
+PAWN_TRANSFORMS = PAWNLESS_TRANSFORMS[:2]
+# a1-d1-d4 triangle
+PAWNLESS_LEAD_SQUARES = [row * 8 + col for row in range(4) for col in range(row, 4)]
+PAWN_LEAD_SQUARES = [row * 8 + col for row in range(8) for col in range(4)]
+
+
+def side_letters(position, color):
+    return ''.join(letter * popcount(position.pieces[color][LETTER_TYPES[letter]]) for letter in TABLE_LETTERS)
+
+def table_name(position):
+    # (name, swapped): swapped when black is the stronger side and the position has
+    # to be looked up with the colors exchanged.
+    white = side_letters(position, WHITE)
+    black = side_letters(position, BLACK)
+    strength = lambda letters: (len(letters), [-TABLE_LETTERS.index(letter) for letter in letters])
+    if strength(black) > strength(white):
+        return (f"{black}v{white}", True)
+    return (f"{white}v{black}", False)
+
+
+class TableIndex:
+    # Maps positions of one material combination to table indices and back.
+    def __init__(self, name):
+        self.name = name
+        (white, black) = name.split('v')
+        self.pieces = ([(WHITE, LETTER_TYPES[letter]) for letter in white]
+                       + [(BLACK, LETTER_TYPES[letter]) for letter in black])
+        pawns = [i for (i, (_, piece_type)) in enumerate(self.pieces) if piece_type == PAWN]
+        if pawns:
+            self.lead = pawns[0]
+            self.transforms = PAWN_TRANSFORMS
+            self.lead_squares = PAWN_LEAD_SQUARES
+        else:
+            self.lead = 0
+            self.transforms = PAWNLESS_TRANSFORMS
+            self.lead_squares = PAWNLESS_LEAD_SQUARES
+        self.lead_index = {sq: i for (i, sq) in enumerate(self.lead_squares)}
+        self.others = [i for i in range(len(self.pieces)) if i != self.lead]
+        self.size = 2 * len(self.lead_squares) * 64 ** len(self.others)
+
+    def squares(self, position, swapped=False):
+        # Squares of the table's pieces in table order.
+        squares = []
+        for (color, piece_type) in self.pieces:
+            for sq in iter_squares(position.pieces[color ^ swapped][piece_type]):
+                squares.append(sq ^ 56 if swapped else sq)
+        return squares
+
+    def index(self, turn, squares):
+        lead = squares[self.lead]
+        for transform in self.transforms:
+            if transform[lead] in self.lead_index:
+                break
+        index = turn * len(self.lead_squares) + self.lead_index[transform[lead]]
+        for i in self.others:
+            index = index * 64 + transform[squares[i]]
+        return index
+
+    def decode(self, index):
+        # (turn, squares) of a table index.
+        squares = [0] * len(self.pieces)
+        for i in reversed(self.others):
+            squares[i] = index & 63
+            index >>= 6
+        squares[self.lead] = self.lead_squares[index % len(self.lead_squares)]
+        return (index // len(self.lead_squares), squares)
+
+    def position(self, index):
+        # A BitboardPosition for the index, None when the squares do not make a legal
+        # position (two pieces on a square, pawns on the back ranks, the side not to
+        # move in check).
+        (turn, squares) = self.decode(index)
+        if len(set(squares)) != len(squares):
+            return None
+        position = BitboardPosition()
+        for ((color, piece_type), sq) in zip(self.pieces, squares):
+            if piece_type == PAWN and sq // 8 in (0, 7):
+                return None
+            position.put_piece(sq, color, piece_type)
+        position.turn = turn
+        position.key = position.compute_key()
+        if position.in_check(1 - turn):
+            return None
+        return position
+
+
+class TableFile:
+    # One memory-mapped table file: a header, block offsets, then zlib blocks of one
+    # byte per index.
+    def __init__(self, path, cache):
+        self.path = path
+        self.cache = cache
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (self.magic, self.version, self.block_size, self.entries, blocks) = HEADER.unpack_from(self.data, 0)
+        self.offsets = array('I', self.data[HEADER.size:HEADER.size + 4 * (blocks + 1)])
+        if sys.byteorder != 'little':
+            self.offsets.byteswap()
+
+    def get(self, index):
+        block = index // self.block_size
+        data = self.cache.get((self.path, block))
+        if data is None:
+            data = zlib.decompress(self.data[self.offsets[block]:self.offsets[block + 1]])
+            self.cache.put((self.path, block), data)
+        return data[index % self.block_size]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+class BlockCache:
+    # Least recently used decompressed blocks, shared by all tables.
+    def __init__(self, max_blocks=256):
+        self.max_blocks = max_blocks
+        self.blocks = collections.OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        data = self.blocks.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.blocks.move_to_end(key)
+        return data
+
+    def put(self, key, data):
+        self.blocks[key] = data
+        if len(self.blocks) > self.max_blocks:
+            self.blocks.popitem(last=False)
+
+
+def write_table(path, magic, values, block_size=BLOCK_SIZE):
+    blocks = [zlib.compress(bytes(values[start:start + block_size]), 9)
+              for start in range(0, len(values), block_size)]
+    offset = HEADER.size + 4 * (len(blocks) + 1)
+    offsets = array('I')
+    for block in blocks:
+        offsets.append(offset)
+        offset += len(block)
+    offsets.append(offset)
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(magic, 1, block_size, len(values), len(blocks)))
+        file.write(offsets.tobytes())
+        for block in blocks:
+            file.write(block)
+
+
+class Tablebase:
+    # Tables found in a directory. Files are opened on first use and their blocks
+    # decompressed on demand into a shared LRU cache. probe_limit caps the number of
+    # pieces of positions the search probes (default: the largest table found).
+    def __init__(self, directory, cache_blocks=256, probe_limit=None):
+        self.directory = directory
+        self.cache = BlockCache(cache_blocks)
+        self.names = {}
+        for file_name in os.listdir(directory):
+            if file_name.endswith(WDL_SUFFIX):
+                self.names[file_name[:-len(WDL_SUFFIX)]] = os.path.join(directory, file_name[:-len(WDL_SUFFIX)])
+        self.max_pieces = max((len(name) - 1 for name in self.names), default=0)
+        self.probe_limit = self.max_pieces if probe_limit is None else min(probe_limit, self.max_pieces)
+        self.indexes = {}
+        self.files = {}
+
+    def __table(self, name, suffix):
+        key = (name, suffix)
+        if key not in self.files:
+            path = self.names.get(name)
+            self.files[key] = TableFile(path + suffix, self.cache) if path and os.path.exists(path + suffix) else None
+            if name not in self.indexes:
+                self.indexes[name] = TableIndex(name)
+        return self.files[key]
+
+    def __lookup(self, position, suffix):
+        # Stored byte for the position, None when there is no table for it.
+        (name, swapped) = table_name(position)
+        table = self.__table(name, suffix)
+        if table is None:
+            return None
+        index = self.indexes[name]
+        return table.get(index.index(position.turn ^ swapped, index.squares(position, swapped)))
+
+    def probe_wdl(self, position):
+        # LOSS ... WIN for the side to move, None when the position is not covered.
+        if position.castling:
+            return None
+        if position.is_insufficient_material():
+            return DRAW
+        value = self.__lookup(position, WDL_SUFFIX)
+        if value is None or value == INVALID:
+            return None
+        value -= 2
+        if position.ep_square is not None:
+            value = self.__with_en_passant(position, value)
+        return value
+
+    def __with_en_passant(self, position, value):
+        # Tables hold positions without en-passant rights: an en-passant capture can
+        # only improve on the stored value, unless it is the only legal move.
+        moves = position.legal_moves()
+        captures = [move for move in moves if move & SPECIAL and position.piece_type_at(move_from(move)) == PAWN]
+        if not captures:
+            return value
+        best = LOSS
+        for move in captures:
+            position.make_move(move)
+            child = self.probe_wdl(position)
+            position.unmake_move()
+            if child is not None:
+                best = max(best, -child)
+        return best if len(captures) == len(moves) else max(value, best)
+
+    def probe_dtz(self, position):
+        # Plies to the next zeroing move (or mate) with best play, positive when the
+        # side to move wins, negative when it loses, 0 for draws. None when the
+        # position is not covered.
+        wdl = self.probe_wdl(position)
+        if wdl is None:
+            return None
+        if wdl == DRAW:
+            return 0
+        dtz = self.__lookup(position, DTZ_SUFFIX)
+        if dtz is None:
+            return None
+        return dtz if wdl > 0 else -dtz
+
+    def best_move(self, position):
+        # (move, wdl, dtz) of the move that keeps the best result fastest (a win) or
+        # longest (a loss), None when the position is not covered.
+        if popcount(position.all_occupied()) > self.probe_limit or self.probe_wdl(position) is None:
+            return None
+        best = None
+        for move in position.legal_moves():
+            zeroing = position.piece_type_at(move_from(move)) == PAWN or position.piece_type_at(move_to(move)) >= 0
+            position.make_move(move)
+            wdl = self.probe_wdl(position)
+            dtz = self.probe_dtz(position) if wdl is not None else None
+            if not position.legal_moves():
+                distance = 0
+            else:
+                distance = 0 if zeroing or dtz is None else abs(dtz)
+            position.unmake_move()
+            if wdl is None:
+                continue
+            # better result first; winning faster, losing slower
+            rank = (-wdl, -distance if wdl < 0 else distance)
+            if best is None or rank > best[0]:
+                best = (rank, move, -wdl, distance + 1 if wdl else 0)
+        if best is None:
+            return None
+        return (best[1], best[2], best[3] if best[2] > 0 else -best[3])
+
+    def score(self, position, ply):
+        # Search score of a tablebase position, None when it is not covered. Wins that
+        # the fifty-move rule would spoil count as draws.
+        wdl = self.probe_wdl(position)
+        if wdl is None:
+            return None
+        if wdl == WIN:
+            return TB_WIN_SCORE - ply
+        if wdl == LOSS:
+            return -TB_WIN_SCORE + ply
+        return 0
+
+    def close(self):
+        for table in self.files.values():
+            if table is not None:
+                table.close()
+        self.files = {}
+
+
+def generate(name, directory, out=sys.stdout):
+    # Solves one material combination by retrograde analysis and writes its WDL and
+    # DTZ files to directory. Captures and promotions lead into smaller tables, which
+    # must be generated first. Meant for three or four pieces, Python is too slow for
+    # more.
+    start = time.perf_counter()
+    table_index = TableIndex(name)
+    tablebase = Tablebase(directory) if os.path.isdir(directory) else None
+    size = table_index.size
+    unknown = 127
+    wdl = bytearray([unknown]) * size
+    dtz = array('H', bytes(2 * size))
+    # in-table children as index * 2 + zeroing flag, and the WDL values (for the side
+    # to move there) of children in other tables
+    children = [None] * size
+    outside = [None] * size
+    valid = bytearray(size)
+
+    for index in range(size):
+        position = table_index.position(index)
+        if position is None:
+            continue
+        valid[index] = 1
+        moves = position.legal_moves()
+        if not moves:
+            wdl[index] = LOSS + 2 if position.in_check() else DRAW + 2
+            continue
+        inside = array('I')
+        other = []
+        for move in moves:
+            zeroing = position.piece_type_at(move_from(move)) == PAWN or position.piece_type_at(move_to(move)) >= 0
+            position.make_move(move)
+            (child_name, _) = table_name(position)
+            if child_name == name:
+                inside.append(table_index.index(position.turn, table_index.squares(position)) * 2 + zeroing)
+            else:
+                value = DRAW if position.is_insufficient_material() else None
+                if value is None and tablebase is not None:
+                    value = tablebase.probe_wdl(position)
+                if value is None:
+                    raise ValueError(f"{name} needs the {child_name} table")
+                # cursed and blessed results of smaller tables count as plain ones here
+                other.append(WIN if value > 0 else LOSS if value < 0 else DRAW)
+            position.unmake_move()
+        children[index] = inside
+        outside[index] = other
+    if tablebase is not None:
+        tablebase.close()
+
+    # win/draw/loss: repeat until nothing changes, what is left is a draw
+    changed = True
+    while changed:
+        changed = False
+        for index in range(size):
+            if wdl[index] != unknown or not valid[index]:
+                continue
+            values = [-value for value in outside[index]]
+            values += [2 - wdl[child >> 1] if wdl[child >> 1] != unknown else None for child in children[index]]
+            if WIN in values:
+                wdl[index] = WIN + 2
+                changed = True
+            elif None not in values and all(value == LOSS for value in values):
+                wdl[index] = LOSS + 2
+                changed = True
+    for index in range(size):
+        if wdl[index] == unknown:
+            wdl[index] = DRAW + 2
+
+    # distance to zeroing: a win needs one move to a lost child, zeroing or with a
+    # known distance; a loss is settled when all its children are
+    resolved = bytearray(size)
+    for index in range(size):
+        if not valid[index] or wdl[index] == DRAW + 2 or children[index] is None:
+            resolved[index] = 1
+    distance = 1
+    while True:
+        settled = []
+        for index in range(size):
+            if resolved[index]:
+                continue
+            if wdl[index] == WIN + 2:
+                if (any(value == LOSS for value in outside[index])
+                        or any(wdl[child >> 1] == LOSS + 2 and (child & 1 or (resolved[child >> 1] and dtz[child >> 1] < distance))
+                               for child in children[index])):
+                    settled.append(index)
+            elif all(child & 1 or (resolved[child >> 1] and dtz[child >> 1] < distance) for child in children[index]):
+                settled.append(index)
+        if not settled:
+            break
+        for index in settled:
+            resolved[index] = 1
+            dtz[index] = distance
+        distance += 1
+
+    wdl_values = bytearray(size)
+    dtz_values = bytearray(size)
+    for index in range(size):
+        if not valid[index]:
+            wdl_values[index] = INVALID
+            continue
+        value = wdl[index] - 2
+        # results the fifty-move rule can spoil
+        if value == WIN and dtz[index] > 100:
+            value = CURSED_WIN
+        elif value == LOSS and dtz[index] > 100:
+            value = BLESSED_LOSS
+        wdl_values[index] = value + 2
+        dtz_values[index] = min(dtz[index], 255)
+    os.makedirs(directory, exist_ok=True)
+    write_table(os.path.join(directory, name + WDL_SUFFIX), WDL_MAGIC, wdl_values)
+    write_table(os.path.join(directory, name + DTZ_SUFFIX), DTZ_MAGIC, dtz_values)
+    counts = collections.Counter(wdl_values)
+    print(f"{name}: {counts[WIN + 2]} wins, {counts[DRAW + 2]} draws, {counts[LOSS + 2]} losses, "
+          f"longest dtz {max(dtz)}, {time.perf_counter() - start:.1f}s", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate or probe endgame tables.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("generate", help="generate tables, smaller endings first")
+    build.add_argument("names", nargs="+", help="e.g. KQvK KRvK KPvK")
+    build.add_argument("--dir", default="tablebases")
+    probe = commands.add_parser("probe", help="probe a position")
+    probe.add_argument("fen")
+    probe.add_argument("--dir", default="tablebases")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        for name in args.names:
+            generate(name, args.dir)
+    else:
+        position = BitboardPosition.from_fen(args.fen)
+        tablebase = Tablebase(args.dir)
+        print(f"wdl {tablebase.probe_wdl(position)} dtz {tablebase.probe_dtz(position)}")
+        best = tablebase.best_move(position)
+        if best is not None:
+            print(f"best {move_to_uci(best[0])} wdl {best[1]} dtz {best[2]}")
+        tablebase.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+from array import array
+
+EXACT, LOWER, UPPER = 1, 2, 3
+
+# Every entry is two 64-bit words: the data word packs the score (bits 0-31, offset by
+# 2**31), move (32-47), depth (48-55) and bound (56-63), and the check word holds the
+# position key xor the data. A probe only accepts an entry whose words agree with the
+# key, so an entry torn by another process writing it at the same time is a miss, not
+# a score from some other position.
+ENTRY_SIZE = 16
+SCORE_OFFSET = 1 << 31
+
+
+def table_bytes(size_mb):
+    return max(1, int(size_mb * 1024 * 1024) // (2 * ENTRY_SIZE)) * 2 * ENTRY_SIZE
+
+def pack_entry(score, move, depth, bound):
+    return (score + SCORE_OFFSET) | (move << 32) | ((depth & 0xFF) << 48) | (bound << 56)
+
+def unpack_entry(data):
+    # (move, score, depth, bound)
+    depth = (data >> 48) & 0xFF
+    return ((data >> 32) & 0xFFFF, (data & 0xFFFFFFFF) - SCORE_OFFSET, depth - 256 if depth > 127 else depth,
+            data >> 56)
+
+
+class TranspositionTable:
+    # Fixed-size table of two-entry buckets held in flat preallocated arrays. The first
+    # slot of a bucket keeps the deepest result seen for it, the second slot is always
+    # replaced, so memory use never grows past size_mb.
+    # With a buffer (e.g. multiprocessing shared memory of table_bytes(size_mb) bytes)
+    # the arrays are views into it, so several processes can share one table; clear is
+    # False to attach to a table that others already use.
+    def __init__(self, size_mb=16, buffer=None, clear=True):
+        self.size_mb = size_mb
+        self.buckets = max(1, int(size_mb * 1024 * 1024) // (2 * ENTRY_SIZE))
+        self.buffer = buffer
+        entries = 2 * self.buckets
+        if buffer is None:
+            self.checks = array('Q', bytes(8 * entries))
+            self.datas = array('Q', bytes(8 * entries))
+        else:
+            view = memoryview(buffer)
+            self.checks = view[:8 * entries].cast('Q')
+            self.datas = view[8 * entries:16 * entries].cast('Q')
+        self.hits = self.misses = self.collisions = self.stores = 0
+        if clear:
+            self.clear()
+
+    def clear(self):
+        entries = 2 * self.buckets
+        if self.buffer is None:
+            self.checks = array('Q', bytes(8 * entries))
+            self.datas = array('Q', bytes(8 * entries))
+        else:
+            memoryview(self.buffer)[:ENTRY_SIZE * entries] = bytes(ENTRY_SIZE * entries)
+        self.hits = self.misses = self.collisions = self.stores = 0
+
+    def probe(self, key):
+        # Returns (move, score, depth, bound) or None.
+        index = (key % self.buckets) << 1
+        datas = self.datas
+        data = datas[index]
+        if data and self.checks[index] ^ data == key:
+            self.hits += 1
+            return unpack_entry(data)
+        index += 1
+        data = datas[index]
+        if data and self.checks[index] ^ data == key:
+            self.hits += 1
+            return unpack_entry(data)
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, bound, score, move):
+        index = (key % self.buckets) << 1
+        datas = self.datas
+        data = datas[index]
+        same = data and self.checks[index] ^ data == key
+        if same or not data or depth >= unpack_entry(data)[2]:
+            if same and not move:
+                move = (data >> 32) & 0xFFFF
+        else:
+            index += 1
+            data = datas[index]
+            same = data and self.checks[index] ^ data == key
+        if data and not same:
+            self.collisions += 1
+        self.stores += 1
+        data = pack_entry(score, move, min(depth, 127), bound)
+        self.checks[index] = key ^ data
+        datas[index] = data
+
+    def get_move(self, key):
+        entry = self.probe(key)
+        return entry[0] if entry is not None else 0
+
+    def fill(self):
+        # Fraction of entries in use, sampled on the first thousand buckets.
+        sample = min(1000, self.buckets) * 2
+        used = sum(1 for i in range(sample) if self.datas[i])
+        return used / sample
+
+    def stats(self):
+        return {"size_mb": self.size_mb,
+                "entries": 2 * self.buckets,
+                "hits": self.hits,
+                "misses": self.misses,
+                "collisions": self.collisions,
+                "stores": self.stores,
+                "fill": self.fill()}
@@ -0,0 +1,343 @@
+import os
+import sys
+import threading
+import time
+
+from chess import instrument
+from chess.book import OpeningBook
+from chess.bitboard import COLOR_NAMES, WHITE, move_to_uci
+from chess.parallel import ParallelSearcher
+from chess.perft import START_FEN
+from chess.pgn import parse_uci
+from chess.position import Position
+from chess.search import Searcher, MATE_SCORE, MAX_PLY
+from chess.tablebase import Tablebase, SYZYGY_SUFFIXES
+from chess.transposition import TranspositionTable
+
+ENGINE_NAME = "Chess-engine"
+ENGINE_AUTHOR = "HenryXander"
+
+# Time kept back from every move for process and GUI overhead.
+MOVE_OVERHEAD_MS = 50
+
+
+def time_budget(remaining_ms, increment_ms=0, moves_to_go=None):
+    # Milliseconds to spend on this move out of the remaining clock time.
+    if remaining_ms is None:
+        return None
+    budget = remaining_ms // (moves_to_go or 30) + increment_ms * 3 // 4
+    return max(10, min(budget, remaining_ms // 2, remaining_ms - MOVE_OVERHEAD_MS))
+
+def format_score(score):
+    if abs(score) >= MATE_SCORE - MAX_PLY:
+        plies = MATE_SCORE - abs(score)
+        return f"mate {(plies + 1) // 2 if score > 0 else -((plies + 1) // 2)}"
+    return f"cp {score}"
+
+def format_info(result):
+    line = (f"info depth {result['depth']} score {format_score(result['score'])} nodes {result['nodes']} "
+            f"nps {result['nps']} time {result['time_ms']}")
+    if result["pv"]:
+        line += " pv " + " ".join(move_to_uci(move) for move in result["pv"])
+    return line
+
+
+class UciEngine:
+    # Universal Chess Interface on text streams. Commands are read on the calling
+    # thread; every search runs on its own thread so that stop and ponderhit are
+    # handled while it thinks.
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.output_lock = threading.Lock()
+        self.hash_mb = 16
+        self.threads = 1
+        self.tt = TranspositionTable(self.hash_mb)
+        self.parallel_searcher = None
+        self.book = None
+        self.tablebase = None
+        self.tb_probe_limit = 7
+        self.fen = START_FEN
+        self.moves = []
+        self.position = Position()
+        self.searcher = None
+        self.search_thread = None
+        # set when a ponder or infinite search may report its best move
+        self.release = threading.Event()
+        self.pondering = False
+        self.ponder_time_ms = None
+
+    def send(self, line):
+        with self.output_lock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+    def run(self, lines=sys.stdin):
+        for line in lines:
+            # a malformed command is reported and skipped, the engine keeps running
+            try:
+                if not self.handle(line):
+                    break
+            except Exception as error:
+                self.send(f"info string error in {line.strip()!r}: {error}")
+        self.stop()
+        self.close()
+        if self.book is not None:
+            self.book.close()
+        self.close_tablebase()
+
+    def handle(self, line):
+        # Runs one command, returns False on quit.
+        tokens = line.split()
+        if not tokens:
+            return True
+        (command, args) = (tokens[0], tokens[1:])
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send("option name Hash type spin default 16 min 1 max 4096")
+            self.send("option name Threads type spin default 1 min 1 max 64")
+            self.send("option name Ponder type check default false")
+            self.send("option name BookFile type string default <empty>")
+            self.send("option name Stats type check default false")
+            self.send("option name EndgameTablesPath type string default <empty>")
+            self.send("option name EndgameTablesProbeLimit type spin default 7 min 0 max 7")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.stop()
+            self.tt.clear()
+            self.set_position(START_FEN, [])
+        elif command == "setoption":
+            self.stop()
+            self.set_option(args)
+        elif command == "position":
+            self.stop()
+            self.position_command(args)
+        elif command == "go":
+            self.stop()
+            self.go(args)
+        elif command == "stop":
+            self.stop()
+        elif command == "ponderhit":
+            self.ponderhit()
+        elif command == "quit":
+            return False
+        return True
+
+    def set_option(self, args):
+        text = " ".join(args)
+        if not text.startswith("name ") or " value " not in text:
+            return
+        (name, value) = text[5:].split(" value ", 1)
+        name = name.strip().lower()
+        if name in ("hash", "threads", "endgametablesprobelimit"):
+            try:
+                int(value)
+            except ValueError:
+                self.send(f"info string option {name} needs an integer, not {value.strip()!r}")
+                return
+        if name == "hash":
+            self.hash_mb = max(1, int(value))
+            self.tt = TranspositionTable(self.hash_mb)
+            self.close()
+        elif name == "threads":
+            self.threads = max(1, int(value))
+            self.close()
+        elif name == "stats":
+            if value.strip().lower() == "true":
+                instrument.enable()
+            else:
+                instrument.disable()
+        elif name == "endgametablespath":
+            # this engine's own .tbw/.tbz tables (see chess/tablebase.py); Syzygy files
+            # are not supported, hence not the usual SyzygyPath option
+            self.close_tablebase()
+            value = value.strip()
+            if value and value != "<empty>":
+                try:
+                    self.tablebase = Tablebase(value, probe_limit=self.tb_probe_limit)
+                except OSError as error:
+                    self.send(f"info string cannot open tablebases: {error}")
+                    return
+                if not self.tablebase.names:
+                    if any(file_name.endswith(SYZYGY_SUFFIXES) for file_name in os.listdir(value)):
+                        self.send(f"info string {value} holds Syzygy tables, which are not supported; "
+                                  f"generate tables with python -m chess.tablebase generate")
+                    else:
+                        self.send(f"info string no endgame table files (.tbw) in {value}")
+                    self.close_tablebase()
+        elif name == "endgametablesprobelimit":
+            self.tb_probe_limit = int(value)
+            if self.tablebase is not None:
+                self.tablebase.probe_limit = min(self.tb_probe_limit, self.tablebase.max_pieces)
+        elif name == "bookfile":
+            if self.book is not None:
+                self.book.close()
+                self.book = None
+            value = value.strip()
+            if value and value != "<empty>":
+                try:
+                    self.book = OpeningBook(value)
+                except OSError as error:
+                    self.send(f"info string cannot open book: {error}")
+
+    def position_command(self, args):
+        moves = args[args.index("moves") + 1:] if "moves" in args else []
+        fields = args[:args.index("moves")] if "moves" in args else args
+        if fields and fields[0] == "fen":
+            fen = " ".join(fields[1:])
+        else:
+            fen = START_FEN
+        self.set_position(fen, moves)
+
+    def set_position(self, fen, moves):
+        # A GUI resends the whole game before every move, so only the moves that were
+        # not played on the current board yet are replayed.
+        if fen != self.fen or moves[:len(self.moves)] != self.moves:
+            try:
+                position = Position(fen)
+            except ValueError as error:
+                # keep the previous position rather than a broken one
+                self.send(f"info string {error}")
+                return
+            self.fen = fen
+            self.moves = []
+            self.position = position
+        for text in moves[len(self.moves):]:
+            try:
+                move = parse_uci(self.position.bitboard, text)
+            except ValueError as error:
+                self.send(f"info string {error}")
+                return
+            self.position.process_move(COLOR_NAMES[self.position.bitboard.turn], move)
+            self.moves.append(text)
+
+    def go(self, args):
+        options = {}
+        flags = set()
+        i = 0
+        while i < len(args):
+            if args[i] in ("ponder", "infinite"):
+                flags.add(args[i])
+                i += 1
+            elif args[i] == "searchmoves":
+                break
+            else:
+                if i + 1 < len(args):
+                    try:
+                        options[args[i]] = int(args[i + 1])
+                    except ValueError:
+                        self.send(f"info string ignoring go {args[i]} {args[i + 1]}")
+                i += 2
+
+        bitboard = self.position.bitboard
+        if self.book is not None and not flags:
+            # book moves cost no search time at all
+            book_move = self.book.choose(bitboard)
+            if book_move:
+                self.send("info string book move")
+                self.send(f"bestmove {move_to_uci(book_move)}")
+                return
+        (remaining, increment) = ("wtime", "winc") if bitboard.turn == WHITE else ("btime", "binc")
+        time_ms = options.get("movetime")
+        if time_ms is None:
+            time_ms = time_budget(options.get(remaining), options.get(increment, 0), options.get("movestogo"))
+        max_depth = options.get("depth")
+        max_nodes = options.get("nodes")
+
+        if instrument.enabled():
+            instrument.reset()
+        self.release.clear()
+        self.pondering = "ponder" in flags
+        wait = self.pondering or "infinite" in flags or (time_ms is None and max_depth is None and max_nodes is None)
+        if wait:
+            # runs until stop (or ponderhit, which starts the clock)
+            self.ponder_time_ms = time_ms
+            (max_depth, time_ms) = (max_depth if "infinite" in flags else None, None)
+            if max_depth is None:
+                max_depth = MAX_PLY - 1
+        else:
+            self.release.set()
+
+        if self.threads > 1 and not wait and max_nodes is None:
+            if self.parallel_searcher is None:
+                self.parallel_searcher = ParallelSearcher(self.threads, self.hash_mb)
+            target = self.parallel_search
+            self.searcher = None
+        else:
+            self.searcher = Searcher(bitboard, self.tt, lambda result: self.send(format_info(result)), self.tablebase)
+            target = self.search
+        self.search_thread = threading.Thread(target=target, args=(bitboard.copy(), max_depth, time_ms, max_nodes),
+                                              daemon=True)
+        self.search_thread.start()
+
+    def search(self, position, max_depth, time_ms, max_nodes=None):
+        result = self.searcher.search(max_depth, time_ms, max_nodes=max_nodes)
+        self.report(result)
+
+    def parallel_search(self, position, max_depth, time_ms, max_nodes=None):
+        result = self.parallel_searcher.search(position, max_depth, time_ms)
+        self.send(format_info(result))
+        self.report(result)
+
+    def report(self, result):
+        # UCI never lets the engine move on its own while pondering or searching
+        # infinitely, so the best move waits for stop or ponderhit.
+        self.release.wait()
+        if instrument.enabled():
+            self.send(f"info nodes {result['nodes']} nps {result['nps']} time {result['time_ms']} "
+                      f"hashfull {int(result['tt']['fill'] * 1000)}")
+            for line in instrument.info_lines():
+                self.send(line)
+        best = result["best_move"]
+        if best is None:
+            moves = self.position.bitboard.legal_moves()
+            best = moves[0] if moves else None
+        if best is None:
+            self.send("bestmove 0000")
+        elif len(result["pv"]) > 1 and result["pv"][0] == best:
+            self.send(f"bestmove {move_to_uci(best)} ponder {move_to_uci(result['pv'][1])}")
+        else:
+            self.send(f"bestmove {move_to_uci(best)}")
+
+    def ponderhit(self):
+        # The opponent played the expected move: keep searching, now on the clock.
+        if not self.pondering or self.searcher is None:
+            return
+        self.pondering = False
+        if self.ponder_time_ms is not None:
+            self.searcher.deadline = time.perf_counter() + self.ponder_time_ms / 1000.0
+        self.release.set()
+
+    def stop(self):
+        if self.search_thread is None:
+            return
+        if self.searcher is not None:
+            self.searcher.stop()
+        elif self.parallel_searcher is not None:
+            self.parallel_searcher.stop()
+        self.release.set()
+        self.search_thread.join()
+        self.search_thread = None
+        self.searcher = None
+        self.pondering = False
+
+    def close_tablebase(self):
+        if self.tablebase is not None:
+            self.tablebase.close()
+            self.tablebase = None
+
+    def close(self):
+        # releases the worker processes; the book stays open across option changes
+        if self.parallel_searcher is not None:
+            self.parallel_searcher.close()
+            self.parallel_searcher = None
+
+
+def main():
+    UciEngine().run()
+
+
+if __name__ == "__main__":
+    main()
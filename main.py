@@ -1,8 +1,30 @@
-from chess.game import Game
+import argparse
+import os
+import sys
 
-def main():
-    game = Game()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play chess in a window, against a human or the engine.")
+    parser.add_argument("--white", choices=("human", "engine"), default="human")
+    parser.add_argument("--black", choices=("human", "engine"), default="human")
+    parser.add_argument("--fen", default=None, help="start from this position")
+    parser.add_argument("--movetime", type=int, default=1000, help="engine milliseconds per move")
+    parser.add_argument("--threads", type=int, default=1, help="engine search processes")
+    parser.add_argument("--ponder", action="store_true", help="let the engine think on the human's time")
+    parser.add_argument("--book", default=None, help="Polyglot opening book for the engine")
+    parser.add_argument("--tables", default=None, help="directory of endgame tables (.tbw/.tbz)")
+    parser.add_argument("--headless", action="store_true", help="no window (SDL dummy video driver), for testing")
+    args = parser.parse_args(argv)
+    if args.headless:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+
+    # pygame is only imported once the video driver is chosen
+    from chess.board import Board
+    from chess.game import Game
+
+    game = Game(Board(args.fen), args.white, args.black, args.movetime, args.threads, ponder=args.ponder,
+                book=args.book, tablebase=args.tables)
     game.play()
+    return 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())